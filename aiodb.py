@@ -0,0 +1,65 @@
+# Async facade over db.py for the ASGI serving mode. sqlite3 has no async driver in the
+# standard library, so each call runs on a small dedicated thread pool (the model aiosqlite
+# uses) and the event loop never waits on the database.
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+ASYNC_DB_THREADS = int(os.environ.get("ASYNC_DB_THREADS", str(db.POOL_SIZE)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ASYNC_DB_THREADS, thread_name_prefix="aiodb")
+        return _executor
+
+
+async def run(fn, *args, **kwargs):
+    # Run a blocking database call off the event loop, keeping the caller's context (metrics)
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), call)
+
+
+async def fetch_history_page(username, limit, after=None):
+    return await run(db.fetch_history_page, username, limit, after)
+
+
+async def load_session(backend, sid):
+    return await run(backend.load, sid)
+
+
+async def save_session(backend, sid, data, ttl):
+    await run(backend.save, sid, data, ttl)
+
+
+async def touch_session(backend, sid, ttl):
+    await run(backend.touch, sid, ttl)
+
+
+async def delete_session(backend, sid):
+    await run(backend.delete, sid)
+
+
+def close():
+    if _executor is not None:
+        _executor.shutdown(wait=True)
@@ -0,0 +1,168 @@
+# Population analytics over processed.csv for /analytics. The file is read once into columnar
+# NumPy arrays (categoricals as integer codes) and the unfiltered group-bys are precomputed;
+# filtered queries are a boolean mask plus np.bincount per metric. Like the knowledge base,
+# the snapshot is swapped for a new one when the file's mtime or size changes.
+import csv
+import os
+import threading
+import time
+
+import numpy as np
+
+from features import CATEGORIES, LABELS
+
+ANALYTICS_PATH = os.environ.get("ANALYTICS_PATH", "processed.csv")
+# How often (seconds) a request may stat the file to look for changes
+ANALYTICS_CHECK_INTERVAL = float(os.environ.get("ANALYTICS_CHECK_INTERVAL", "5"))
+
+AGE_EDGES = (30, 40, 50, 60, 70)
+AGE_BANDS = ("<30", "30-39", "40-49", "50-59", "60-69", "70+")
+# Group-by dimensions: name -> (source column, vocabulary)
+DIMENSIONS = {
+    "age_band": ("Age", AGE_BANDS),
+    "gender": ("Gender", tuple(CATEGORIES["Gender"])),
+    "dietary_habits": ("Dietary_Habits", tuple(CATEGORIES["Dietary_Habits"])),
+    "disease": ("Chronic_Disease", tuple(LABELS)),
+}
+METRICS = ("BMI", "Blood_Pressure_Systolic", "Blood_Pressure_Diastolic", "Cholesterol_Level")
+
+
+class AnalyticsError(ValueError):
+    # Bad query from the client
+    pass
+
+
+class AnalyticsDataError(Exception):
+    # processed.csv can't be read or parsed; not the client's fault
+    pass
+
+
+class Cohort:
+    # One immutable load of the CSV: codes per dimension, float arrays per metric
+
+    def __init__(self, path):
+        # OSError if the file can't be opened, AnalyticsDataError if its contents can't be parsed
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+            self._load(rows)
+        except (KeyError, ValueError) as e:
+            raise AnalyticsDataError(f"{path}: {type(e).__name__}: {e}") from e
+
+    def _load(self, rows):
+        self.rows = len(rows)
+        self.codes = {}
+        for name, (column, vocab) in DIMENSIONS.items():
+            if name == "age_band":
+                age = np.array([float(r[column]) for r in rows])
+                self.age = age
+                self.codes[name] = np.searchsorted(AGE_EDGES, age, side="right").astype(np.intp)
+                continue
+            lookup = {v: i for i, v in enumerate(vocab)}
+            try:
+                self.codes[name] = np.array([lookup[r[column]] for r in rows], dtype=np.intp)
+            except KeyError as e:
+                raise ValueError(f"unexpected {column} value {e.args[0]!r}") from None
+        self.metrics = {m: np.array([float(r[m]) for r in rows]) for m in METRICS}
+        self.precomputed = {name: self._aggregate(name, None) for name in DIMENSIONS}
+        self.overall = self._aggregate(None, None)
+
+    def _aggregate(self, group_by, mask):
+        # -> list of {"key", "count", "disease_distribution", "mean"} (one entry when group_by is None)
+        if group_by is None:
+            keys, groups = ("all",), np.zeros(self.rows, dtype=np.intp)
+        else:
+            keys, groups = DIMENSIONS[group_by][1], self.codes[group_by]
+        disease = self.codes["disease"]
+        if mask is not None:
+            groups, disease = groups[mask], disease[mask]
+        n_groups, n_labels = len(keys), len(LABELS)
+        counts = np.bincount(groups, minlength=n_groups)
+        dist = np.bincount(groups * n_labels + disease, minlength=n_groups * n_labels).reshape(n_groups, n_labels)
+        sums = {m: np.bincount(groups, weights=v if mask is None else v[mask], minlength=n_groups)
+                for m, v in self.metrics.items()}
+        out = []
+        for g, key in enumerate(keys):
+            count = int(counts[g])
+            out.append({
+                "key": key,
+                "count": count,
+                "disease_distribution": {label: int(dist[g, i]) for i, label in enumerate(LABELS)},
+                "mean": {m: round(float(s[g]) / count, 2) if count else None for m, s in sums.items()},
+            })
+        return out
+
+    def query(self, group_by=None, filters=None, age_min=None, age_max=None):
+        if group_by is not None and group_by not in DIMENSIONS:
+            raise AnalyticsError(f"Unknown group_by {group_by!r}; expected one of {', '.join(DIMENSIONS)}")
+        mask = None
+        for name, value in (filters or {}).items():
+            vocab = DIMENSIONS[name][1]
+            if value not in vocab:
+                raise AnalyticsError(f"Unknown {name} {value!r}; expected one of {', '.join(vocab)}")
+            m = self.codes[name] == vocab.index(value)
+            mask = m if mask is None else mask & m
+        if age_min is not None:
+            m = self.age >= age_min
+            mask = m if mask is None else mask & m
+        if age_max is not None:
+            m = self.age <= age_max
+            mask = m if mask is None else mask & m
+        if mask is None:
+            # No filters: answered from the precomputed aggregates
+            return self.rows, self.precomputed[group_by] if group_by else self.overall
+        return int(mask.sum()), self._aggregate(group_by, mask)
+
+
+class Analytics:
+    # Readers take the current snapshot without locking; reloads are published by rebinding
+
+    def __init__(self, path=ANALYTICS_PATH, check_interval=ANALYTICS_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None  # ((mtime_ns, size), Cohort, loaded_at)
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def cohort(self):
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() >= self._next_check:
+            snapshot = self._refresh()
+        return snapshot
+
+    def _refresh(self):
+        first_load = self._snapshot is None
+        if not self._reload_lock.acquire(blocking=first_load):
+            return self._snapshot
+        try:
+            snapshot = self._snapshot
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                st = os.stat(self.path)
+                version = (st.st_mtime_ns, st.st_size)
+                if snapshot is not None and snapshot[0] == version:
+                    return snapshot
+                cohort = Cohort(self.path)
+            except (OSError, AnalyticsDataError) as e:
+                if snapshot is None:
+                    raise
+                print(f"[WARN] Keeping previous analytics data, could not reload {self.path}: {e}")
+                return snapshot
+            snapshot = (version, cohort, time.time())
+            self._snapshot = snapshot
+            return snapshot
+        finally:
+            self._reload_lock.release()
+
+    def query(self, group_by=None, filters=None, age_min=None, age_max=None):
+        _, cohort, loaded_at = self.cohort()
+        matched, groups = cohort.query(group_by, filters, age_min, age_max)
+        return {
+            "rows": matched,
+            "group_by": group_by,
+            "groups": groups,
+            "source": {"path": self.path, "rows": cohort.rows, "loaded_at": loaded_at},
+        }
+
+
+analytics = Analytics()
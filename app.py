@@ -1,481 +1,516 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
-import joblib
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, g, Response
 import numpy as np
 import os, random
 import json
+import csv
+import io
+import time
 from datetime import timedelta, datetime
 import re
-import sqlite3
-from encryption import encrypt_prediction_data, decrypt_prediction_data
+import base64
+import db
+from features import FEATURES, LABELS, CATEGORIES, map_label
+from encoder import encoder, EncodeError, RANGES
+from model_registry import registry, ModelLoadError
+from prediction_cache import prediction_cache
+from intents import IntentMatcher
+from knowledge_base import knowledge_base
+from session_store import make_session_interface
+from encryption import decrypt_many_parallel
+from metrics import metrics
+from analytics import analytics, AnalyticsDataError, DIMENSIONS
+from similar_patients import similar_patients
+from diet_plans import diet_plans
+from rate_limit import RATE_LIMIT, bulk_limiter, predict_limiter, signin_limiter, retry_after_header
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "change-me-please")
 
-# -------- Load model & scaler (place your files under Models/) --------
-MODEL_PATH = "Models/model.sav"
-SCALER_PATH = "Models/scaler.sav"
+# Session data (prediction, tip rotation) is kept server-side; the cookie only holds an ID
+_session_interface = make_session_interface()
+if _session_interface is not None:
+    app.session_interface = _session_interface
 
-def safe_load(path):
-    try:
-        return joblib.load(path)
-    except Exception as e:
-        print(f"[WARN] Could not load {path}: {e}")
-        return None
+# -------- Load model & scaler (place your files under Models/) --------
+# Loaded and warmed up once per worker before it serves traffic. A missing or mismatched
+# artifact aborts startup unless MODEL_STRICT=0, in which case /predict reports the error.
+MODEL_STRICT = os.environ.get("MODEL_STRICT", "1") == "1"
+# Features listed in a prediction's explanation, strongest first
+EXPLAIN_TOP_K = int(os.environ.get("EXPLAIN_TOP_K", "5"))
+# Cached /predict results are score_row dicts; bump when their shape changes
+RESULT_FORMAT = 1
+
+def result_key_prefix():
+    # Model hash plus everything that shapes a cached result, so the shared cache tier never
+    # serves results built under another MODEL_EXPLAIN / EXPLAIN_TOP_K setting
+    return (f"{registry.model_hash}:format={RESULT_FORMAT}:explain={registry.explainer is not None}"
+            f":top_k={EXPLAIN_TOP_K}")
+
+try:
+    registry.load()
+    prediction_cache.set_model_hash(result_key_prefix())
+except ModelLoadError as e:
+    if MODEL_STRICT:
+        raise
+    print(f"[WARN] {e}")
 
-model = safe_load(MODEL_PATH)
-scaler = safe_load(SCALER_PATH)
-
-# -------- feature order (must match training) --------
-FEATURES = [
-    'Age','Gender','Height_cm','Weight_kg','BMI',
-    'Blood_Pressure_Systolic','Blood_Pressure_Diastolic',
-    'Cholesterol_Level','Blood_Sugar_Level','Genetic_Risk_Factor',
-    'Allergies','Daily_Steps','Exercise_Frequency','Sleep_Hours',
-    'Alcohol_Consumption','Smoking_Habit','Dietary_Habits',
-    'Caloric_Intake','Protein_Intake','Carbohydrate_Intake','Fat_Intake'
+# -------- Database initialization --------
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+HISTORY_MIGRATIONS = [
+    # 1: composite index for the per-user, newest-first paginated history query
+    '''
+    CREATE INDEX IF NOT EXISTS idx_history_user_created
+    ON prediction_history (username, created_at DESC, id)
+    ''',
+    # 2: newest id first within a second, matching the page queries' tie-break
+    '''
+    CREATE INDEX IF NOT EXISTS idx_history_user_created_id
+    ON prediction_history (username, created_at DESC, id DESC)
+    ''',
+    'DROP INDEX IF EXISTS idx_history_user_created',
 ]
 
-LABELS = ['Diabetes','Heart Disease','Hypertension','Obesity', 'None']
-
-# -------- Database initialization --------
 def init_prediction_history_db():
     # Initialize the database for prediction history
-    con = sqlite3.connect('signup.db')
-    cur = con.cursor()
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS prediction_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            encrypted_data TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    con.commit()
-    con.close()
+    with db.pool.connection() as con:
+        con.execute('''
+            CREATE TABLE IF NOT EXISTS prediction_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                encrypted_data TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        for i, sql in enumerate(HISTORY_MIGRATIONS[version:], start=version + 1):
+            con.execute(sql)
+            con.execute(f"PRAGMA user_version = {i}")
 
 # Initialize database on startup
 init_prediction_history_db()
 
-def map_label(raw):
+# -------- Guidance knowledge base (guidance.json: 60 tips per disease, 20 diet, 20 habits, 20 prevention) --------
+# Loaded on the first /chat/send and hot-reloaded when the file changes; the intent
+# matcher is compiled once at startup so /chat/send cost doesn't grow with the knowledge base
+INTENTS = IntentMatcher()
+
+# -------- Instrumentation --------
+# Each request is sampled (METRICS_SAMPLE_RATE) for latency and per-stage spans; see /metrics
+@app.before_request
+def _begin_metrics():
+    g.metrics_token = metrics.begin_request()
+
+@app.after_request
+def _end_metrics(response):
+    metrics.end_request(g.pop("metrics_token", None), request.endpoint, response.status_code)
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus text exposition for this worker process
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# -------- Prediction / chat / history cores --------
+# Shared by the Flask views below and the async handlers in asgi.py. `sess` is any session
+# mapping (flask.session or asgi.py's server-side session) with a writable .modified flag.
+def score_row(model, Xs):
+    # {"prediction", "probabilities", "explanation"} for one scaled row. With the registry's
+    # explainer, probabilities, label and contributions come out of one forest traversal.
+    explainer = registry.explainer
+    if explainer is not None:
+        proba, contributions = explainer.explain(Xs)
+        classes = explainer.classes_
+    elif hasattr(model, "predict_proba"):
+        proba, contributions, classes = model.predict_proba(Xs), None, model.classes_
+    else:
+        return {"prediction": map_label(model.predict(Xs)[0]), "probabilities": None, "explanation": None}
+    labels = [map_label(c) for c in classes]
+    best = int(np.argmax(proba[0]))
+    explanation = None
+    if contributions is not None:
+        # Contribution of each feature to the predicted class's probability; ties keep FEATURES order
+        toward = contributions[0, :, best]
+        top = np.argsort(-np.abs(toward), kind="stable")[:EXPLAIN_TOP_K]
+        explanation = [{"feature": FEATURES[j], "contribution": round(float(toward[j]), 4)} for j in top]
+    return {
+        "prediction": labels[best],
+        "probabilities": {label: round(float(p), 4) for label, p in zip(labels, proba[0])},
+        "explanation": explanation,
+    }
+
+def predict_result(X, vals):
+    # score_row for one encoded row; raises ModelLoadError when no model is serving
+    model, scaler = registry.get()
+
+    def compute():
+        with metrics.span("predict.transform"):
+            Xs = scaler.transform(X)
+        with metrics.span("predict.model"):
+            return score_row(model, Xs)
+
+    # Resubmitted forms skip scaling and inference; concurrent identical ones share one inference
+    with metrics.span("predict.cache_lookup"):
+        cache_key = prediction_cache.key(vals)
+        result = prediction_cache.get(cache_key)
+    if result is not None:
+        return result
+    return prediction_cache.compute_once(cache_key, compute)
+
+def record_prediction(sess, vals, result):
+    # Store prediction in session, with the encoded inputs for /predict/whatif
+    pred = result["prediction"]
+    sess["prediction"] = pred
+    sess["last_inputs"] = vals
+    # clear rotation indices for new session/prediction
+    sess["rot"] = {}
+
+    # Hand the record to the background history writer (it encrypts and commits)
+    username = sess.get('username')
+    if username:
+        try:
+            inputs_dict = dict(zip(FEATURES, vals))
+            with metrics.span("predict.history_enqueue"):
+                db.save_history(username, inputs_dict, pred, result["probabilities"], result["explanation"])
+        except Exception as e:
+            print(f"Error saving prediction history: {e}")
+
+def check_rate_limit(limiter, sess, remote_addr, cost=1):
+    # None when the request may proceed, else seconds until the client has cost tokens.
+    # Signed-in clients are limited per username, everyone else per IP.
+    if not RATE_LIMIT:
+        return None
+    username = sess.get("username")
+    allowed, retry_after = limiter.allow(f"user:{username}" if username else f"ip:{remote_addr}", cost)
+    return None if allowed else retry_after
+
+def find_similar(X):
+    # "Patients like you" for the chat page; None when the index can't be built or loaded
+    try:
+        with metrics.span("predict.similar"):
+            return similar_patients.query(X)
+    except Exception as e:
+        print(f"[WARN] Similar patients unavailable: {type(e).__name__}: {e}")
+        return None
+
+def find_diet_plan(pred, vals):
+    # Precomputed macro targets and meal plan for the prediction's cohort cell; None if unavailable
+    try:
+        with metrics.span("predict.diet_plan"):
+            return diet_plans.lookup(pred, vals)
+    except Exception as e:
+        print(f"[WARN] Diet plan unavailable: {type(e).__name__}: {e}")
+        return None
+
+def chat_reply(sess, message):
+    user_text = (message or "").lower()
+    disease = sess.get("prediction", "None")
+    disease = map_label(disease) if not isinstance(disease, str) or disease in LABELS else str(disease)
+
+    # intent detection
+    bucket = INTENTS.match(user_text)
+    if bucket is None and "more" == user_text.strip():
+        # if user asks "more", return next tip across buckets in rotation preference
+        bucket = sess.get("last_bucket", "diet")
+
+    reply = ""
+    if bucket is None:
+        reply = (f"Hi — I can provide tips for *diet*, *habits* (exercise/sleep/stress), or *prevention* "
+                 f"for {disease}. Try asking: 'diet', 'habits', or 'prevention'.")
+    else:
+        items = knowledge_base.tips().get(disease, bucket)
+        if not items:
+            reply = "I don't have items for that category; try another (diet/habits/prevention)."
+        else:
+            # rotation index stored in session to give variety
+            rot = sess.setdefault("rot", {}).get(f"{disease}_{bucket}", 0)
+            tip = items[rot % len(items)]
+            # increment and store
+            sess["rot"][f"{disease}_{bucket}"] = (rot + 1) % len(items)
+            sess.modified = True
+            reply = f"{bucket.title()} tip: {tip}"
+            sess["last_bucket"] = bucket
+
+    return {"reply": reply, "disease": disease}
+
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "20"))
+
+def encode_history_cursor(created_at, record_id):
+    raw = json.dumps([created_at, record_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_history_cursor(cursor):
+    # Returns (created_at, id) or None for a missing/malformed cursor
+    if not cursor:
+        return None
     try:
-        if isinstance(raw, (int, np.integer)):
-            return LABELS[int(raw)]
-        if isinstance(raw, str):
-            if raw in LABELS:
-                return raw
-            if raw.isdigit() and int(raw) < len(LABELS):
-                return LABELS[int(raw)]
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, record_id = json.loads(raw)
+        return str(created_at), int(record_id)
     except Exception:
-        pass
-    return str(raw)
-
-# -------- Extensive guidance knowledge base (60 tips per disease: 20 diet, 20 habits, 20 prevention) --------
-GUIDANCE = {
-    "None": {
-        "diet": [
-            "Half your plate vegetables at lunch and dinner.",
-            "Rotate whole grains: oats, brown rice, millets, quinoa.",
-            "Add a source of protein to every meal (eggs, legumes, fish, lean meat).",
-            "Drink water instead of sugar-sweetened beverages.",
-            "Snack on fruit, yogurt, or a handful of nuts.",
-            "Cook with measured amounts of healthy oil (olive/mustard) — avoid free-pouring.",
-            "Try a new vegetable every week to increase variety.",
-            "Prefer whole fruit to fruit juice to preserve fiber.",
-            "Batch-cook legumes and whole grains for quick healthy meals.",
-            "Start meals with a salad or vegetable soup to reduce overeating.",
-            "Season with herbs and spices instead of extra salt.",
-            "Choose minimally processed items most of the time.",
-            "Keep desserts small and infrequent.",
-            "Aim for 25–30 g fiber daily from plant sources.",
-            "Include probiotic foods like curd/yogurt occasionally.",
-            "Have 2–3 alcohol-free days per week.",
-            "Limit packaged snacks and read labels for hidden sugar/salt.",
-            "Finish dinner 2–3 hours before sleep.",
-            "Use smaller plates to naturally reduce portions.",
-            "Plan balanced weekly menus to avoid impulsive takeout."
-        ],
-        "habits": [
-            "Aim for 150–300 minutes of moderate activity weekly.",
-            "Include 2–3 sessions of strength training per week.",
-            "Stand up and move for 2–5 minutes every hour of sitting.",
-            "Take a 10–15 minute walk after main meals.",
-            "Keep a consistent sleep schedule: 7–9 hours nightly.",
-            "Practice 5 minutes of deep breathing daily to lower stress.",
-            "Hydrate throughout the day—keep a bottle visible as a reminder.",
-            "Take stairs instead of lifts where safe.",
-            "Schedule and keep preventive health checkups annually.",
-            "Track steps/sleep for two weeks to learn your baseline.",
-            "Create a wind-down pre-sleep routine: dim lights, no screens 30–60 min before bed.",
-            "Plan active social time: walking dates, sport with friends.",
-            "Do 5–10 minutes of mobility/stretching every morning.",
-            "Stand during phone calls or pacing meetings.",
-            "Meal-prep on a chosen day to reduce weekday decision fatigue.",
-            "Celebrate small wins to build habit momentum.",
-            "Keep comfortable walking shoes handy to nudge movement.",
-            "Pair TV time with standing or light exercises.",
-            "Set hydration and posture reminders during the workday.",
-            "Adopt a short after-dinner tidy walk: 10 minutes every evening."
-        ],
-        "prevention": [
-            "Maintain healthy BMI and protect muscle mass with resistance work.",
-            "Monitor BP, fasting glucose, and lipids as advised by provider.",
-            "Stay current with age-appropriate screenings (cancer, eye, etc.).",
-            "Use sunscreen and sun-protective habits outdoors.",
-            "Get recommended vaccinations (influenza, etc.).",
-            "Foster social support and regular social activities.",
-            "Practice daily micro-stress relief (breathing, short meditations).",
-            "Avoid tobacco and limit alcohol consumption.",
-            "Guard sleep hygiene—treat snoring or disrupted sleep if present.",
-            "Have a basic first-aid and medication checklist when traveling.",
-            "Reassess lifestyle goals every quarter to maintain progress.",
-            "Keep a standing desk or sit-stand routine if possible.",
-            "Organize emergency contacts and medication lists.",
-            "Reduce excessive noise exposure and protect hearing.",
-            "Keep good oral hygiene—gum health influences systemic inflammation.",
-            "Plan grocery lists focused on whole foods rather than impulse buys.",
-            "Stay alert to work-related stress and take recovery days.",
-            "Ensure hydration strategies during hot weather or intense activity.",
-            "Use sensory relaxation before bed: calm music, reading.",
-            "Build an environment that makes healthy choices easy (visible water, prepared veggies)."
-        ]
-    },
-
-    "Diabetes": {
-        "diet": [
-            "Prefer low-GI carbohydrates: oats, barley, millets, quinoa, brown rice.",
-            "Make non-starchy vegetables half your plate (greens, cruciferous veg).",
-            "Include a healthy protein source with every meal (eggs, dal, fish, tofu).",
-            "Avoid sugar-sweetened beverages—choose water or unsweetened tea.",
-            "Break large meals into smaller, regular meals to reduce post-meal spikes.",
-            "Use vinegar or lemon-based dressings to blunt carbohydrate response.",
-            "Favor boiling/steaming/grilling over deep-frying.",
-            "Carry a protein/fiber snack (roasted chana, nuts, yogurt) to avoid high-sugar snacks.",
-            "Prefer whole fruit over smoothies or fruit juices to keep fiber intact.",
-            "Limit refined grains and sweets—reserve them for special occasions only.",
-            "Aim for 25–35 g fiber/day via pulses, vegetables, fruits, and whole grains.",
-            "Swap white rice for brown rice or millet mixes where possible.",
-            "Choose portion-controlled measures for rice and bread (use the plate rule).",
-            "Include healthy fats (olive oil, nuts, avocado) in moderate amounts.",
-            "Limit alcohol intake; monitor its effect on blood sugar.",
-            "Prefer low-fat dairy options or plain yogurt instead of flavored versions.",
-            "Add non-starchy vegetable-based starters like salad or soup to meals.",
-            "Use herbs/spices like cinnamon, fenugreek (methi) as adjuncts after checking tolerance.",
-            "Avoid dried fruits as everyday snacks—they concentrate sugar.",
-            "Read labels to spot hidden sugars (maltodextrin, dextrose, syrups)."
-        ],
-        "habits": [
-            "Take a 10–20 minute walk after main meals to lower post-meal glucose.",
-            "Accumulate 150–300 minutes/week of aerobic activity (walking/cycling/swimming).",
-            "Add 2–3 resistance sessions/week to increase muscle glucose uptake.",
-            "Maintain consistent sleep (7–9 hours); poor sleep raises glucose.",
-            "Use a glucometer per clinician advice—track fasting and post-meal levels.",
-            "Perform a daily foot check: inspect for cuts, blisters, or infections.",
-            "Carry a small hypo-kit (glucose tablets, small snack) if on insulin or sulfonylureas.",
-            "Keep a simple log of food, activity, and glucose to find patterns.",
-            "Coordinate medication/insulin timing with meals as instructed by clinician.",
-            "Set reminders for medication and glucose checks on busy days.",
-            "Stay hydrated—dehydration can increase blood sugar readings.",
-            "Break long sitting times each hour with 2–5 minutes of movement.",
-            "Plan ahead for holidays—choose smaller dessert portions and extra activity.",
-            "Discuss supplement options with healthcare provider before use.",
-            "Schedule retinal (eye) checks yearly if diabetic for early detection.",
-            "Get kidney function tests as advised to detect changes early.",
-            "Wear well-fitting shoes to reduce risk of foot injury.",
-            "Use mindful eating techniques to reduce overeating and binge episodes.",
-            "Discuss CGM (continuous glucose monitoring) with your clinician if available.",
-            "Have a documented sick-day plan for medication and food intake adjustments."
-        ],
-        "prevention": [
-            "Aim for modest weight loss (5–10% of body weight) if overweight—big impact on risk.",
-            "Protect lean mass with protein and regular resistance training.",
-            "Quit smoking to reduce vascular and metabolic risks.",
-            "Keep blood pressure and lipids in target ranges to reduce complications.",
-            "Get HbA1c checked every 3–6 months as advised.",
-            "Keep annual eye exams and foot exams scheduled and attended.",
-            "Get vaccinated (influenza, pneumococcal) to lower complication risks.",
-            "Create a family/friend hypoglycemia action plan if on insulin.",
-            "Address sleep apnea (snoring, daytime sleepiness) to improve metabolic control.",
-            "Have an emergency medical ID if on insulin or with severe hypoglycemia risk.",
-            "Plan structured follow-ups with diabetes educator and dietitian.",
-            "Practice stress-reduction techniques consistently to blunt stress-induced glucose rises.",
-            "Ensure dental checks—periodontal disease is linked with poorer glycemic control.",
-            "Review medications annually with clinician to optimize regimens.",
-            "Carry a simple carbohydrate source during exercise or long activities.",
-            "Read package labels and be able to count carbs for portion planning.",
-            "Consider structured behavior programs for weight and glucose control.",
-            "Work on sleep hygiene—poor sleep affects appetite hormones and glucose.",
-            "Educate household members on hypo/hyperglycemia recognition and care.",
-            "Keep realistic, measurable goals and celebrate adherence milestones."
-        ]
-    },
-
-    "Heart Disease": {
-        "diet": [
-            "Use heart-healthy oils (olive, canola, mustard) in measured amounts.",
-            "Limit saturated fats (butter, ghee, full-fat dairy) and replace with lean proteins.",
-            "Avoid trans fats: packaged baked goods and repeated deep-frying.",
-            "Eat oily fish (salmon, mackerel) 1–2 times weekly or plant omega-3 sources (flax, chia).",
-            "Choose whole grains (oats, brown rice, millet) over refined grains.",
-            "Increase intake of vegetables and berries for antioxidants and fiber.",
-            "Limit salt intake and flavor with herbs, spices, garlic, and citrus.",
-            "Prefer home-cooked meals to better control sodium and fat.",
-            "Snack on unsalted nuts in moderation (almonds, walnuts).",
-            "Limit sugar-sweetened beverages and refined sweets.",
-            "Choose lean cuts of meat and remove visible fat before cooking.",
-            "Replace creamy sauces with tomato- or yogurt-based versions.",
-            "Include legumes regularly as a protein and fiber source.",
-            "Choose low-fat dairy or fortified plant alternatives where appropriate.",
-            "Limit processed meats (bacon, sausages) that are high in sodium & nitrates.",
-            "Reduce refined carbohydrate loads—balance carbs with protein & fiber.",
-            "Add garlic and turmeric for flavor and potential anti-inflammatory benefits.",
-            "Use portion control—measure oils and servings rather than free-hand serving.",
-            "Limit fried and fast-food frequency to special occasional meals.",
-            "Read labels for sodium and trans fat — choose lowest options."
-        ],
-        "habits": [
-            "Accumulate 150–300 minutes/week of moderate-intensity aerobic activity.",
-            "Include 2–3 resistance training sessions weekly for muscle strength.",
-            "Break long sitting periods every 30–60 minutes for short activity.",
-            "Stop smoking and avoid exposure to secondhand smoke.",
-            "Monitor blood pressure and cholesterol at intervals recommended by your clinician.",
-            "Limit alcohol; follow clinician guidance on safe levels.",
-            "Practice daily stress-management (breathing, meditation, short walks).",
-            "Aim for 7–9 hours of quality sleep to support heart health.",
-            "Use a pillbox, alarms, or apps to improve medication adherence.",
-            "Walk after meals to support blood pressure and glucose responses.",
-            "Engage in social activities to reduce loneliness—beneficial for cardiac outcomes.",
-            "Plan active leisure (hikes, biking, dancing) rather than sedentary pastimes.",
-            "Build a home first-aid/medication list and share with family members.",
-            "Practice mindful eating to avoid overeating and large post-prandial loads.",
-            "Avoid intense exertion if you have known coronary disease without clinician clearance.",
-            "Keep weight in a healthy range via diet and activity.",
-            "Prioritize dental care—gum disease is associated with higher cardiovascular risk.",
-            "Use heart-rate or step goals to help maintain regular activity.",
-            "Limit caffeine intake if it causes palpitations or anxiety.",
-            "Schedule periodic cardiac reviews with your clinician if risk factors exist."
-        ],
-        "prevention": [
-            "Aim for LDL and HDL targets as advised by your clinician—diet + meds as needed.",
-            "Keep blood pressure under recommended thresholds for your risk profile.",
-            "Manage diabetes tightly—good glucose control reduces vascular damage.",
-            "Maintain waist circumference and BMI targets to reduce metabolic burden.",
-            "Know the symptoms of heart attack & have an action plan (call emergency services).",
-            "Stay current with vaccinations to avoid cardiac complications from infections.",
-            "Use stress-management tools during high-pressure seasons (work/deadlines).",
-            "Avoid prolonged exposure to heavy air pollution for outdoor exercise—choose low-pollution times.",
-            "Have an action plan for angina or unusual chest discomfort and emergency contacts.",
-            "Encourage family screening if there is a strong family history of heart disease.",
-            "Take cardiac medications exactly as prescribed and track refills.",
-            "Work with a dietitian for structured heart-healthy meal planning when needed.",
-            "Address sleep disorders—untreated sleep apnea increases cardiac risk.",
-            "Ensure thyroid function is checked if cholesterol remains high despite therapy.",
-            "Understand safe exercise progressions—avoid abrupt increases.",
-            "Carry relevant medical ID if you have implantable devices or important medications.",
-            "Check alcohol intake and reduce if it elevates blood pressure or interacts with meds.",
-            "Be cautious with supplements—discuss with clinician to avoid interactions.",
-            "Build a long-term plan for medication optimization and lifestyle maintenance.",
-            "Plan holiday and travel strategies for diet/activity to prevent lapses."
-        ]
-    },
-
-    "Hypertension": {
-        "diet": [
-            "Adopt DASH-style plates: vegetables, fruits, whole grains, low-fat dairy, legumes.",
-            "Reduce sodium intake — target 1.5–2.3 g/day depending on clinician advice.",
-            "Avoid high-sodium packaged foods (soups, sauces, instant noodles).",
-            "Rinse canned vegetables/beans to remove excess sodium where possible.",
-            "Use potassium-rich foods (bananas, spinach, tomatoes, sweet potato) to support BP.",
-            "Flavor with herbs, citrus, vinegar, and garlic instead of salt.",
-            "Prefer whole grains and fiber-rich cereals over refined carbs.",
-            "Eat unsalted nuts and seeds as snacks instead of salted chips.",
-            "Limit alcohol intake—excess raises blood pressure.",
-            "Choose low-sodium dairy or reduced-salt cheese options.",
-            "Avoid processed meats and cured foods high in sodium.",
-            "Use low-sodium broths when cooking soups or stews.",
-            "Limit pickles and sauces consumed at the table.",
-            "Moderate caffeine; consider your personal sensitivity when exercising or before bed.",
-            "Opt for fresh or frozen vegetables without sauces or added salt.",
-            "Incorporate oats/psyllium for soluble fiber to help with lipids.",
-            "Keep hydration steady—dehydration sometimes causes compensatory BP changes.",
-            "Consider hibiscus tea in moderation—some benefit shown for BP lowering.",
-            "Plan meals with herbs like coriander, cumin, and pepper for complexity without salt.",
-            "Avoid energy drinks that can spike blood pressure."
-        ],
-        "habits": [
-            "Aim for 20–40 min of moderate aerobic activity daily—start gently and build up.",
-            "Include 2 strength sessions per week to support vascular health.",
-            "Practice daily breathing or meditation (4–7–8 or box breathing).",
-            "Sleep 7–9 hours on a regular schedule to support BP regulation.",
-            "Check home blood pressure twice daily initially to establish baseline.",
-            "Stand and move hourly to reduce vascular stiffness from sitting.",
-            "Weigh weekly when actively reducing weight; small losses can lower BP.",
-            "Avoid tobacco in any form; even occasional use worsens BP.",
-            "Set medication reminders to avoid missed doses.",
-            "Reduce screen time close to bedtime to improve sleep quality.",
-            "Plan active commuting or short walking meetings when possible.",
-            "Avoid heavy lifting spikes unless medically cleared—they transiently raise BP.",
-            "Make home-cooked meals to control salt and portion sizes.",
-            "Use a simple relaxation routine pre-bed (warm shower, breathing) to lower nighttime BP.",
-            "Pair TV time with light mobility or stretching to reduce sedentary load.",
-            "Identify personal stress triggers and a short response plan (5-min walk, breathing).",
-            "Have a calibrated home BP cuff and log values to discuss with clinician.",
-            "Limit NSAID overuse—these can raise blood pressure in some individuals.",
-            "Avoid excessive licorice and certain herbal supplements that can raise BP.",
-            "Build a social support system to help maintain lifestyle adjustments."
-        ],
-        "prevention": [
-            "Treat BP consistently—do not stop meds without clinician guidance.",
-            "Aim for gradual weight reduction if overweight to help lower BP.",
-            "Address sleep apnea if loud snoring/daytime sleepiness occur—treating it lowers BP.",
-            "Reassess the salt content of favorite recipes monthly and reduce gradually.",
-            "Avoid chronic high-stress exposure by planning recovery days.",
-            "Coordinate care if you have diabetes or kidney disease; combined risks raise priority.",
-            "Check kidney function and electrolytes as advised by clinician.",
-            "Keep alcohol intake well within recommended limits.",
-            "Have an action plan for sudden very high readings (contact clinician/emergency services).",
-            "Avoid extreme diets that may cause electrolyte disturbances affecting BP.",
-            "Stay mindful of medication interactions (e.g., decongestants raise BP).",
-            "Use relaxation apps or short daily guided meditations to reduce baseline stress.",
-            "Educate family on when to seek urgent help for severe BP-related symptoms.",
-            "Plan lower-sodium restaurant choices: ask for sauces/salt on the side.",
-            "Monitor caffeine and stimulant-containing supplement use.",
-            "Consider supervised exercise programs if starting new routines.",
-            "Keep track of dietary potassium sources and maintain balance with clinician advice.",
-            "Recheck BP after travel or sleep routine disruptions.",
-            "Avoid energy drinks and stimulant-heavy preworkout supplements.",
-            "Engage in community support or groups for chronic disease prevention accountability."
-        ]
-    },
-
-    "Obesity": {
-        "diet": [
-            "Create a small calorie deficit (≈300–500 kcal/day) for sustainable weight loss.",
-            "Prioritize protein at each meal to support satiety and muscle retention.",
-            "Fill half the plate with vegetables to increase volume without many calories.",
-            "Swap sugary drinks and juices for plain water or unsweetened tea.",
-            "Limit highly-processed hyper-palatable foods kept at home.",
-            "Plan two balanced snacks daily to reduce binge impulses.",
-            "Use smaller plates and bowls to reduce portions automatically.",
-            "Batch-cook lean proteins and vegetables for easy, healthy meals.",
-            "Avoid skipping breakfast to reduce later-day overeating for many people.",
-            "Choose whole grains and fiber-rich carbs for lasting fullness.",
-            "Measure oil and nut servings — they’re nutritious but calorie-dense.",
-            "Replace creamy sauces with tomato or yogurt-based alternatives.",
-            "Favor home-cooked meals to control ingredients and portions.",
-            "Limit alcohol—alcohol adds calories and reduces inhibitions.",
-            "Keep fruit visible and sweets out of immediate sight for habit control.",
-            "Plan meals for busy days to avoid fast-food fallback.",
-            "Replace vending machine snacks with fruit, yogurt, or unsalted nuts.",
-            "Prepare a simple protein-based breakfast to curb mid-day cravings.",
-            "Use vinegar or citrus to add flavor without calories.",
-            "Track intake for a short sample period to learn true calorie habits."
-        ],
-        "habits": [
-            "Aim for at least 150 minutes/week moderate activity, increase to 250–300 for greater weight loss.",
-            "Include 2–3 resistance training sessions/week to preserve muscle mass.",
-            "Increase NEAT: take stairs, park further, stand for tasks when possible.",
-            "Sleep 7–9 hours; poor sleep dysregulates appetite and hunger hormones.",
-            "Plan grocery shops with a list and avoid shopping when hungry.",
-            "Keep trigger foods out of the home environment or out of sight.",
-            "Use mindful eating: chew slowly, pause between bites, notice fullness.",
-            "Track body weight weekly rather than daily to smooth noise.",
-            "Celebrate non-scale victories (energy, improved fitness, clothing fit).",
-            "Use accountability: a friend, coach, or support group can help adherence.",
-            "Pair sedentary hobbies with mini-active breaks (e.g., walk during ads).",
-            "Take short walks after meals to assist satiety and glucose control.",
-            "Build incremental changes—one sustainable habit per week.",
-            "Keep a small home kit (band, mat, light dumbbells) to remove barriers to exercise.",
-            "Avoid all-or-nothing thinking; aim for progress over perfection.",
-            "Use automated reminders to plan workouts and wind-down routines.",
-            "Pre-log meals in a tracker to set realistic daily intake targets.",
-            "Plan active weekend activities (hiking, cycling) to boost weekly activity.",
-            "Limit screen time in the evening to improve sleep and reduce nighttime snacking.",
-            "Practice stress-management tools to reduce emotional eating triggers."
-        ],
-        "prevention": [
-            "Protect muscle mass during weight loss with adequate protein and resistance training.",
-            "Get baseline labs (glucose, lipids, liver enzymes) and repeat as advised.",
-            "Screen for sleep apnea if you snore or have daytime sleepiness.",
-            "Consider behavioral therapy for emotional or binge eating patterns.",
-            "Set realistic, incremental weight targets (e.g., 0.25–0.75 kg/week).",
-            "Plan holiday strategies to avoid large setbacks (small portions, extra activity).",
-            "Use a long-term maintenance plan after weight loss—do not expect 'finish line'.",
-            "Engage a registered dietitian for personalized planning when needed.",
-            "Monitor for weight-regain triggers and have a rapid action plan.",
-            "Avoid crash dieting; they often cause rebound weight gain.",
-            "Use meal prep to increase adherence on busy days.",
-            "Keep healthy snacks in your bag and car to avoid poor choices when hungry.",
-            "Review medications with clinician if weight gain seems medication-related.",
-            "Encourage family-based changes to make the environment supportive.",
-            "Plan for relapse events—identify triggers and a recovery strategy.",
-            "Use a combination of diet, activity, sleep, and stress management for best outcomes.",
-            "Consider structured programs or supervised exercise if self-guided attempts plateau.",
-            "Check for endocrine contributors (thyroid, Cushing’s) if unexplained weight changes occur.",
-            "Recognize that maintenance is a distinct phase—plan support for it.",
-            "Work on healthy body image and psychological well-being alongside weight goals."
-        ]
-    }
-}  # end GUIDANCE
+        return None
+
+def split_history_page(records):
+    # records were fetched with HISTORY_PAGE_SIZE + 1 rows to learn whether an older page exists
+    if len(records) <= HISTORY_PAGE_SIZE:
+        return records, None
+    records = records[:HISTORY_PAGE_SIZE]
+    last = records[-1]
+    return records, encode_history_cursor(last[2], last[0])
+
+def decrypt_history_page(username, records):
+    # Decrypt the page with a cached cipher context (large pages fan out to the decrypt pool)
+    def report(i, e):
+        print(f"Error decrypting record {records[i][0]}: {e}")
+
+    with metrics.span("history.decrypt"):
+        decrypted_rows = decrypt_many_parallel(username, [record[1] for record in records], on_error=report)
+    history_data = []
+    for i, (record, decrypted) in enumerate(zip(records, decrypted_rows)):
+        if decrypted is None:
+            continue
+        if not isinstance(decrypted, dict):
+            report(i, "unexpected payload format")
+            continue
+        history_data.append({
+            'id': record[0],
+            'inputs': decrypted.get('inputs', {}),
+            'prediction': decrypted.get('prediction', 'Unknown'),
+            'probabilities': decrypted.get('probabilities'),
+            'explanation': decrypted.get('explanation'),
+            'created_at': record[2]
+        })
+    return history_data
 
 # -------- Routes --------
 @app.route("/predict", methods=["GET", "POST"])
 def predict():
     err = None
     if request.method == "POST":
-        vals = []
-        for f in FEATURES:
-            v = request.form.get(f, "").strip()
-            if v == "":
-                err = f"Missing value for {f}"
-                return render_template("home.html", features=FEATURES, error=err)
-            try:
-                vals.append(float(v))
-            except ValueError:
-                err = f"Invalid numeric value for {f}"
-                return render_template("home.html", features=FEATURES, error=err)
-        X = np.array(vals, dtype=float).reshape(1, -1)
-        Xs = scaler.transform(X) if scaler is not None else X
-        if model is None:
+        retry_after = check_rate_limit(predict_limiter, session, request.remote_addr)
+        if retry_after is not None:
+            err = "Too many predictions in a short time. Please wait a moment and try again."
+            return (render_template("home.html", features=FEATURES, error=err), 429,
+                    {"Retry-After": retry_after_header(retry_after)})
+        try:
+            with metrics.span("predict.parse"):
+                X = encoder.encode_one(request.form)
+        except EncodeError as e:
+            return render_template("home.html", features=FEATURES, error=str(e))
+        vals = X[0].tolist()
+        try:
+            result = predict_result(X, vals)
+        except ModelLoadError:
             #pred = 0
             err = "Error: Model is not loaded properly. Please check the model file."
             return render_template("home.html", features=FEATURES, error=err)
-        else:
-            raw = model.predict(Xs)[0]
-            label = map_label(raw)
-            pred = label
+        record_prediction(session, vals, result)
+        pred = result["prediction"]
+        similar = find_similar(X)
+        diet_plan = find_diet_plan(pred, vals)
         
-        # Store prediction in session
-        session["prediction"] = pred
-        # clear rotation indices for new session/prediction
-        session["rot"] = {}
-        
-        # Save encrypted prediction data to database
-        username = session.get('username')
-        if username:
-            try:
-                # Create inputs dictionary
-                inputs_dict = {}
-                for i, f in enumerate(FEATURES):
-                    inputs_dict[f] = vals[i]
-                
-                # Encrypt the data
-                encrypted_data = encrypt_prediction_data(username, inputs_dict, pred)
-                
-                # Save to database
-                con = sqlite3.connect('signup.db')
-                cur = con.cursor()
-                cur.execute('''
-                    INSERT INTO prediction_history (username, encrypted_data)
-                    VALUES (?, ?)
-                ''', (username, encrypted_data))
-                con.commit()
-                con.close()
-            except Exception as e:
-                print(f"Error saving prediction history: {e}")
-        
-        return render_template("chat.html", disease=pred) #redirect(url_for("chat"))
+        with metrics.span("predict.render"):
+            return render_template("chat.html", disease=pred, result=result, similar=similar,
+                                   diet_plan=diet_plan) #redirect(url_for("chat"))
     return render_template("home.html", features=FEATURES, error=err)
 
+# -------- Batch prediction --------
+MAX_BATCH_ROWS = int(os.environ.get("MAX_BATCH_ROWS", "50000"))
+
+def _batch_rows_from_request():
+    # Returns a list of raw rows (each a list in FEATURES order) from a JSON or CSV body
+    upload = request.files.get("file")
+    if upload is not None or (request.mimetype or "").endswith("csv"):
+        text = upload.read().decode("utf-8-sig") if upload is not None else request.get_data(as_text=True)
+        reader = csv.DictReader(io.StringIO(text))
+        missing = [f for f in FEATURES if f not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+        return [[row[f] for f in FEATURES] for row in reader]
+
+    data = request.get_json(silent=True)
+    rows = data.get("rows") if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON list of rows or an object with a 'rows' list")
+    out = []
+    for i, row in enumerate(rows):
+        if isinstance(row, dict):
+            out.append([row.get(f) for f in FEATURES])
+        elif isinstance(row, list) and len(row) == len(FEATURES):
+            out.append(row)
+        else:
+            raise ValueError(f"Row {i}: expected an object keyed by feature or a list of {len(FEATURES)} values")
+    return out
+
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch():
+    """Score many patients with a single scaler/model call"""
+    try:
+        model, scaler = registry.get_batch()
+    except ModelLoadError:
+        return jsonify({"error": "Model is not loaded properly. Please check the model file."}), 503
+    try:
+        rows = _batch_rows_from_request()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": str(e)}), 400
+    if not rows:
+        return jsonify({"error": "No rows to score"}), 400
+    if len(rows) > MAX_BATCH_ROWS:
+        return jsonify({"error": f"Too many rows: {len(rows)} (limit {MAX_BATCH_ROWS})"}), 413
+    retry_after = check_rate_limit(bulk_limiter, session, request.remote_addr, cost=len(rows))
+    if retry_after is not None:
+        return (jsonify({"error": "Too many rows scored in a short time. Please retry later."}), 429,
+                {"Retry-After": retry_after_header(retry_after)})
+
+    start = time.perf_counter()
+    try:
+        X = encoder.encode(rows)
+    except EncodeError as e:
+        return jsonify({"error": "Validation failed", "details": e.errors}), 400
+    Xs = scaler.transform(X)
+    raw = model.predict(Xs)
+    elapsed = time.perf_counter() - start
+
+    labels = [map_label(r) for r in raw]
+    return jsonify({
+        "count": len(labels),
+        "predictions": labels,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "rows_per_sec": round(len(labels) / elapsed, 1) if elapsed > 0 else None,
+    })
+
+# -------- What-if simulation --------
+# Re-scores the session's last /predict inputs with numeric features shifted, e.g.
+# {"deltas": {"Daily_Steps": 3000, "Weight_kg": [-2.5, -5]}}. A list is swept: every
+# combination is one scenario, and the baseline plus all scenarios go through one
+# predict_proba call. Nothing is written to history, the session or the prediction cache.
+WHATIF_MAX_SCENARIOS = int(os.environ.get("WHATIF_MAX_SCENARIOS", "1000"))
+# BMI is derived from Height_cm and Weight_kg rather than varied directly
+WHATIF_FEATURES = [f for f in FEATURES if f not in CATEGORIES and f != "BMI"]
+
+def whatif_grid(base, deltas):
+    # -> (X, names, D, clipped): baseline row then one row per delta combination (D), with
+    # values clipped to encoder.RANGES (clipped marks them); raises ValueError on bad deltas
+    if not isinstance(deltas, dict) or not deltas:
+        raise ValueError("Expected 'deltas': an object mapping features to a number or a list of numbers")
+    names, steps = [], []
+    for name, value in deltas.items():
+        if name not in WHATIF_FEATURES:
+            raise ValueError(f"Can't vary {name!r}; expected one of {', '.join(WHATIF_FEATURES)}")
+        values = value if isinstance(value, list) else [value]
+        if not values or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            raise ValueError(f"{name}: deltas must be a number or a non-empty list of numbers")
+        steps.append(np.asarray(values, dtype=float))
+        names.append(name)
+    if not all(np.isfinite(s).all() for s in steps):
+        raise ValueError("Deltas must be finite numbers")
+    n = int(np.prod([len(s) for s in steps]))
+    if n > WHATIF_MAX_SCENARIOS:
+        raise ValueError(f"Too many scenarios: {n} (limit {WHATIF_MAX_SCENARIOS})")
+
+    D = np.column_stack([m.ravel() for m in np.meshgrid(*steps, indexing="ij")])
+    X = np.repeat(np.asarray(base, dtype=float)[None, :], n + 1, axis=0)
+    cols = [FEATURES.index(f) for f in names]
+    X[1:, cols] += D
+    lo = np.array([RANGES[f][0] for f in names], dtype=float)
+    hi = np.array([RANGES[f][1] for f in names], dtype=float)
+    clipped = (X[1:, cols] < lo) | (X[1:, cols] > hi)
+    X[1:, cols] = np.clip(X[1:, cols], lo, hi)
+    if "Height_cm" in names or "Weight_kg" in names:
+        h, w, bmi = FEATURES.index("Height_cm"), FEATURES.index("Weight_kg"), FEATURES.index("BMI")
+        X[1:, bmi] = np.clip(np.round(X[1:, w] / (X[1:, h] / 100.0) ** 2, 2), *RANGES["BMI"])
+    return X, names, D, clipped
+
+def whatif_scores(X):
+    # (predictions, probabilities) for every row of X in one scaler/model call
+    model, scaler = registry.get_batch()
+    with metrics.span("whatif.model"):
+        proba = model.predict_proba(scaler.transform(X))
+    labels = [map_label(c) for c in model.classes_]
+    predictions = [labels[i] for i in proba.argmax(axis=1)]
+    probabilities = [{label: round(float(p), 4) for label, p in zip(labels, row)} for row in proba]
+    return predictions, probabilities
+
+@app.route("/predict/whatif", methods=["POST"])
+def predict_whatif():
+    """Score deltas (or a sweep grid of them) against the last /predict inputs"""
+    base = session.get("last_inputs")
+    if not base:
+        return jsonify({"error": "No prediction in this session yet; submit /predict first"}), 409
+    data = request.get_json(silent=True)
+    try:
+        X, names, D, clipped = whatif_grid(base, data.get("deltas") if isinstance(data, dict) else None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    retry_after = check_rate_limit(bulk_limiter, session, request.remote_addr, cost=len(X))
+    if retry_after is not None:
+        return (jsonify({"error": "Too many scenarios scored in a short time. Please retry later."}), 429,
+                {"Retry-After": retry_after_header(retry_after)})
+    try:
+        predictions, probabilities = whatif_scores(X)
+    except ModelLoadError:
+        return jsonify({"error": "Model is not loaded properly. Please check the model file."}), 503
+
+    shown = names + ["BMI"] if "Height_cm" in names or "Weight_kg" in names else names
+    cols = [FEATURES.index(f) for f in shown]
+    scenarios = []
+    for i, (d, row_clipped) in enumerate(zip(D.tolist(), clipped), start=1):
+        scenario = {
+            "deltas": dict(zip(names, d)),
+            "inputs": dict(zip(shown, X[i, cols].tolist())),
+            "prediction": predictions[i],
+            "probabilities": probabilities[i],
+        }
+        if row_clipped.any():
+            scenario["clipped"] = [f for f, c in zip(names, row_clipped) if c]
+        scenarios.append(scenario)
+    return jsonify({
+        "baseline": {"inputs": dict(zip(shown, X[0, cols].tolist())),
+                     "prediction": predictions[0], "probabilities": probabilities[0]},
+        "scenarios": scenarios,
+    })
+
+@app.route("/model/status")
+def model_status():
+    # Which artifact is serving, plus load and warm-up timings for this worker
+    return jsonify(registry.status())
+
+@app.route("/predict/cache")
+def prediction_cache_stats():
+    # Hit/miss counters for sizing PREDICTION_CACHE_SIZE
+    return jsonify(prediction_cache.stats())
+
+@app.route("/ratelimit")
+def rate_limit_stats():
+    # Allowed/limited counts and tracked clients for this worker's limiters
+    return jsonify({"enabled": RATE_LIMIT, "predict": predict_limiter.stats(), "signin": signin_limiter.stats(),
+                    "bulk": bulk_limiter.stats()})
+
+# -------- Population analytics --------
+@app.route("/analytics")
+def analytics_endpoint():
+    """Cohort aggregates over processed.csv.
+
+    ?group_by=age_band|gender|dietary_habits|disease, filters gender=, dietary_habits=,
+    disease=, age_min=, age_max=
+    """
+    start = time.perf_counter()
+    args = request.args
+    filters = {name: args[name] for name in DIMENSIONS if name != "age_band" and args.get(name)}
+    try:
+        age_min = float(args["age_min"]) if args.get("age_min") else None
+        age_max = float(args["age_max"]) if args.get("age_max") else None
+        result = analytics.query(args.get("group_by") or None, filters, age_min, age_max)
+    except AnalyticsDataError as e:
+        print(f"Error loading analytics data: {e}")
+        return jsonify({"error": "Analytics data is not available"}), 503
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError as e:
+        print(f"Error loading analytics data: {e}")
+        return jsonify({"error": "Analytics data is not available"}), 503
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return jsonify(result)
+
 @app.route("/chat", methods=["GET"])
 def chat():
     disease = session.get("prediction", "None")
@@ -486,44 +521,7 @@ def chat():
 @app.route("/chat/send", methods=["POST"])
 def chat_send():
     data = request.get_json(force=True)
-    user_text = (data.get("message") or "").lower()
-    disease = session.get("prediction", "None")
-    disease = map_label(disease) if not isinstance(disease, str) or disease in LABELS else str(disease)
-
-    kb = GUIDANCE.get(disease, GUIDANCE["None"])
-
-    # intent detection
-    if any(k in user_text for k in ["diet","food","meal","eat","nutrition","what to eat","foods"]):
-        bucket = "diet"
-    elif any(k in user_text for k in ["habit","exercise","workout","walk","steps","sleep","stress","activity"]):
-        bucket = "habits"
-    elif any(k in user_text for k in ["prevent","prevention","control","reduce risk","avoid","complication"]):
-        bucket = "prevention"
-    elif "more" == user_text.strip():
-        # if user asks "more", return next tip across buckets in rotation preference
-        bucket = session.get("last_bucket", "diet")
-    else:
-        bucket = None
-
-    reply = ""
-    if bucket is None:
-        reply = (f"Hi — I can provide tips for *diet*, *habits* (exercise/sleep/stress), or *prevention* "
-                 f"for {disease}. Try asking: 'diet', 'habits', or 'prevention'.")
-    else:
-        items = kb.get(bucket, [])
-        if not items:
-            reply = "I don't have items for that category; try another (diet/habits/prevention)."
-        else:
-            # rotation index stored in session to give variety
-            rot = session.setdefault("rot", {}).get(f"{disease}_{bucket}", 0)
-            tip = items[rot % len(items)]
-            # increment and store
-            session["rot"][f"{disease}_{bucket}"] = (rot + 1) % len(items)
-            session.modified = True
-            reply = f"{bucket.title()} tip: {tip}"
-            session["last_bucket"] = bucket
-
-    return jsonify({"reply": reply, "disease": disease})
+    return jsonify(chat_reply(session, data.get("message")))
 
 
 
@@ -556,39 +554,41 @@ def signup():
         if not re.match(password_pattern, password):
             return render_template("signup.html", message="Password must be at least 8 characters, with an uppercase letter, a number, and a lowercase letter.")
 
-        con = sqlite3.connect('signup.db')
-        cur = con.cursor()
-        cur.execute("SELECT 1 FROM info WHERE user = ?", (username,))
-        if cur.fetchone():
-            con.close()
+        if db.user_exists(username):
             return render_template("signup.html", message="Username already exists. Please choose another.")
         
-        cur.execute("insert into `info` (`user`,`name`, `email`,`mobile`,`password`) VALUES (?, ?, ?, ?, ?)",(username,name,email,number,password))
-        con.commit()
-        con.close()
+        db.create_user(username, name, email, number, password)
         return redirect(url_for('login'))
 
+def start_user_session(sess, username):
+    # A new server-side session ID on sign-in, so a session ID obtained before it can't be
+    # used to act as the user; Flask's cookie sessions are re-signed on every change anyway
+    if hasattr(sess, "regenerate"):
+        sess.regenerate()
+    sess['username'] = username
+
 @app.route("/signin", methods=["GET", "POST"])
 def signin():
     if request.method == "GET":
         return render_template("signin.html")
     else:
+        retry_after = check_rate_limit(signin_limiter, session, request.remote_addr)
+        if retry_after is not None:
+            return (render_template("signin.html", message="Too many sign-in attempts. Please try again later."),
+                    429, {"Retry-After": retry_after_header(retry_after)})
         mail1 = request.form.get('user','')
         password1 = request.form.get('password','')
-        con = sqlite3.connect('signup.db')
-        cur = con.cursor()
-        cur.execute("select `user`, `password` from info where `user` = ? AND `password` = ?",(mail1,password1,))
-        data = cur.fetchone()
+        data = db.check_credentials(mail1, password1)
 
         if data == None:
             return render_template("signin.html", message="Invalid username or password.")    
 
         elif mail1 == 'admin' and password1 == 'admin':
-            session['username'] = 'admin'
+            start_user_session(session, 'admin')
             return render_template("home.html")
 
         elif mail1 == str(data[0]) and password1 == str(data[1]):
-            session['username'] = mail1
+            start_user_session(session, mail1)
             return render_template("home.html")
         else:
             return render_template("signin.html", message="Invalid username or password.")
@@ -617,39 +617,20 @@ def login():
 
 @app.route('/history')
 def history():
-    """Display prediction history for the logged-in user"""
+    """Display prediction history for the logged-in user, one page at a time"""
     username = session.get('username')
     if not username:
         return redirect(url_for('signin'))
     
+    after = decode_history_cursor(request.args.get('cursor'))
     try:
-        con = sqlite3.connect('signup.db')
-        cur = con.cursor()
-        cur.execute('''
-            SELECT id, encrypted_data, created_at
-            FROM prediction_history
-            WHERE username = ?
-            ORDER BY created_at DESC
-        ''', (username,))
-        records = cur.fetchall()
-        con.close()
-        
-        # Decrypt the data
-        history_data = []
-        for record in records:
-            try:
-                decrypted = decrypt_prediction_data(username, record[1])
-                history_data.append({
-                    'id': record[0],
-                    'inputs': decrypted.get('inputs', {}),
-                    'prediction': decrypted.get('prediction', 'Unknown'),
-                    'created_at': record[2]
-                })
-            except Exception as e:
-                print(f"Error decrypting record {record[0]}: {e}")
-                continue
-        
-        return render_template('history.html', history=history_data, username=username)
+        with metrics.span("history.fetch"):
+            records = db.fetch_history_page(username, HISTORY_PAGE_SIZE + 1, after)
+        records, next_cursor = split_history_page(records)
+        history_data = decrypt_history_page(username, records)
+        with metrics.span("history.render"):
+            return render_template('history.html', history=history_data, username=username,
+                                   next_cursor=next_cursor, is_first_page=after is None)
     except Exception as e:
         print(f"Error fetching history: {e}")
         return render_template('history.html', history=[], username=username, error=str(e))
@@ -0,0 +1,61 @@
+# Writing the derived artifacts under Models/ (lookup indexes, forest exports) that workers
+# memory-map. Rewriting a mapped file in place truncates it under the readers, and their next
+# access to the old mapping dies with SIGBUS; so every writer goes through a temp file in the
+# same directory and os.replace(), which leaves open mappings on the old inode intact.
+import hashlib
+import os
+import shutil
+import tempfile
+
+# Read once at import; os.umask can only be queried by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def file_hash(*paths):
+    # sha256 over the files' contents in order; artifacts and caches key on it to notice changes
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def atomic_write(path, write, mode="wb"):
+    # write(f) fills an open temp file that then replaces path in one rename
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        # mkstemp creates the file 0600; keep the mode a plain open() would have given it
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_dir(path, write):
+    # write(tmp_dir) fills a temp directory that is then renamed over path. The old directory
+    # is moved aside first (rename can't replace a non-empty one), so path is missing for the
+    # moment between the two renames; its files stay readable to whoever mapped them.
+    parent = os.path.dirname(os.path.abspath(path))
+    tmp = tempfile.mkdtemp(dir=parent, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        os.chmod(tmp, 0o777 & ~_UMASK)
+        write(tmp)
+        if os.path.isdir(path):
+            old = tmp + ".old"
+            os.rename(path, old)
+            os.rename(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.rename(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
@@ -0,0 +1,364 @@
+# ASGI serving mode (pip install uvicorn):
+#   gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+# or for a single process:  uvicorn asgi:app
+# (uvicorn's own --workers mode leaves Nagle on for accepted sockets, which costs ~40 ms per
+# keep-alive response; gunicorn's uvicorn worker doesn't, and keeps the shared pre-fork model)
+#
+# POST /predict, POST /chat/send and GET /history are async handlers: inference, decryption and
+# template rendering run on a thread pool, SQLite goes through aiodb, and the event loop stays
+# free for other connections, so many chat sessions share a few workers. Every other route is
+# the unchanged Flask app, called through a buffered WSGI bridge on the same pool.
+#
+# The async handlers read and write server-side sessions directly (SESSION_BACKEND sqlite or
+# memory); with SESSION_BACKEND=cookie every route goes through the bridge instead.
+import asyncio
+import contextvars
+import functools
+import io
+import json
+import os
+import secrets
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from flask import render_template
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import dump_cookie
+
+import aiodb
+import db
+from app import (app as flask_app, FEATURES, HISTORY_PAGE_SIZE, ModelLoadError, EncodeError, encoder,
+                 metrics, predict_result, record_prediction, find_similar, find_diet_plan, chat_reply,
+                 check_rate_limit, decode_history_cursor, split_history_page, decrypt_history_page)
+from diet_plans import diet_plans
+from knowledge_base import knowledge_base
+from rate_limit import predict_limiter, retry_after_header
+from session_store import ServerSideSession, ServerSideSessionInterface
+
+# Threads for inference, decryption, rendering and bridged Flask requests
+ASGI_WORKER_THREADS = int(os.environ.get("ASGI_WORKER_THREADS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ASGI_WORKER_THREADS, thread_name_prefix="asgi")
+        return _executor
+
+
+async def run_sync(fn, *args, **kwargs):
+    # Run blocking or CPU-bound work off the event loop, keeping the caller's context (metrics)
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), call)
+
+
+# -------- Request / response --------
+class Request:
+
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.body = body
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.remote_addr = (scope.get("client") or ("",))[0]
+        self.headers = {}
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1").lower()
+            value = value.decode("latin-1")
+            sep = "; " if name == "cookie" else ","
+            self.headers[name] = f"{self.headers[name]}{sep}{value}" if name in self.headers else value
+        self.query = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+
+    @property
+    def mimetype(self):
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    def cookie(self, name):
+        morsel = SimpleCookie(self.headers.get("cookie", "")).get(name)
+        return morsel.value if morsel is not None else None
+
+    def form(self):
+        return MultiDict(parse_qsl(self.body.decode("utf-8"), keep_blank_values=True))
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+
+def _response(status, body, content_type, headers=()):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return status, [("content-type", content_type), *headers], body
+
+
+def html(body, status=200):
+    return _response(status, body, "text/html; charset=utf-8")
+
+
+def json_response(data, status=200):
+    return _response(status, json.dumps(data), "application/json")
+
+
+def redirect(location):
+    return _response(302, "", "text/html; charset=utf-8", [("location", location)])
+
+
+def _render(path, template, **context):
+    # url_for in the templates needs a request context; sessions are not read from it
+    with flask_app.test_request_context(path):
+        return render_template(template, **context)
+
+
+async def render(req, template, **context):
+    return html(await run_sync(_render, req.path, template, **context))
+
+
+# -------- Sessions --------
+def _session_interface():
+    iface = flask_app.session_interface
+    return iface if isinstance(iface, ServerSideSessionInterface) else None
+
+
+async def open_session(req):
+    iface = _session_interface()
+    iface.start_sweeper()
+    sid = req.cookie(iface.get_cookie_name(flask_app))
+    if sid:
+        entry = await aiodb.load_session(iface.backend, sid)
+        if entry is not None:
+            return ServerSideSession(entry[0], sid=sid, expires=entry[1])
+    return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+
+async def save_session(session, headers):
+    # Mirrors ServerSideSessionInterface.save_session for a raw header list
+    iface = _session_interface()
+    name = iface.get_cookie_name(flask_app)
+    domain = iface.get_cookie_domain(flask_app)
+    path = iface.get_cookie_path(flask_app)
+    if session.previous_sid is not None:
+        await aiodb.delete_session(iface.backend, session.previous_sid)
+    if not session:
+        if session.modified and not session.new:
+            await aiodb.delete_session(iface.backend, session.sid)
+            headers.append(("set-cookie", dump_cookie(name, "", max_age=0, domain=domain, path=path)))
+        return
+    if session.modified:
+        await aiodb.save_session(iface.backend, session.sid, dict(session), iface.ttl)
+    elif iface.needs_touch(session):
+        await aiodb.touch_session(iface.backend, session.sid, iface.ttl)
+    if session.new:
+        headers.append(("vary", "Cookie"))
+        headers.append(("set-cookie", dump_cookie(
+            name, session.sid,
+            expires=iface.get_expiration_time(flask_app, session),
+            httponly=iface.get_cookie_httponly(flask_app),
+            domain=domain, path=path,
+            secure=iface.get_cookie_secure(flask_app),
+            samesite=iface.get_cookie_samesite(flask_app),
+        )))
+
+
+# -------- Async routes --------
+async def predict(req, session):
+    retry_after = check_rate_limit(predict_limiter, session, req.remote_addr)
+    if retry_after is not None:
+        err = "Too many predictions in a short time. Please wait a moment and try again."
+        _, headers, body = await render(req, "home.html", features=FEATURES, error=err)
+        return 429, headers + [("retry-after", retry_after_header(retry_after))], body
+    try:
+        with metrics.span("predict.parse"):
+            X = encoder.encode_one(req.form())
+    except EncodeError as e:
+        return await render(req, "home.html", features=FEATURES, error=str(e))
+    vals = X[0].tolist()
+    try:
+        result = await run_sync(predict_result, X, vals)
+    except ModelLoadError:
+        err = "Error: Model is not loaded properly. Please check the model file."
+        return await render(req, "home.html", features=FEATURES, error=err)
+    # May block under history backpressure, so it doesn't run on the loop
+    await run_sync(record_prediction, session, vals, result)
+    pred = result["prediction"]
+    similar = await run_sync(find_similar, X)
+    # A table lookup; only the first call (loading the table) touches the disk
+    diet_plan = find_diet_plan(pred, vals) if diet_plans.table is not None else await run_sync(find_diet_plan, pred, vals)
+    with metrics.span("predict.render"):
+        return await render(req, "chat.html", disease=pred, result=result, similar=similar,
+                            diet_plan=diet_plan)
+
+
+async def chat_send(req, session):
+    # Intent matching and tip lookup take microseconds; they run on the loop. Loading
+    # guidance.json and the periodic check for changes read the disk, so they don't.
+    try:
+        data = req.json()
+    except ValueError:
+        return json_response({"error": "Invalid JSON"}, 400)
+    message = data.get("message") if isinstance(data, dict) else None
+    if knowledge_base.due():
+        await run_sync(knowledge_base.tips)
+    return json_response(chat_reply(session, message))
+
+
+async def history(req, session):
+    username = session.get("username")
+    if not username:
+        return redirect("/signin")
+
+    after = decode_history_cursor(req.query.get("cursor"))
+    try:
+        with metrics.span("history.fetch"):
+            records = await aiodb.fetch_history_page(username, HISTORY_PAGE_SIZE + 1, after)
+        records, next_cursor = split_history_page(records)
+        history_data = await run_sync(decrypt_history_page, username, records)
+        with metrics.span("history.render"):
+            return await render(req, "history.html", history=history_data, username=username,
+                                next_cursor=next_cursor, is_first_page=after is None)
+    except Exception as e:
+        print(f"Error fetching history: {e}")
+        return await render(req, "history.html", history=[], username=username, error=str(e))
+
+
+ROUTES = {
+    ("POST", "/predict"): ("predict", predict),
+    ("POST", "/chat/send"): ("chat_send", chat_send),
+    ("GET", "/history"): ("history", history),
+}
+
+
+async def dispatch(endpoint, handler, req):
+    token = metrics.begin_request()
+    status = 500
+    try:
+        session = await open_session(req)
+        status, headers, body = await handler(req, session)
+        await save_session(session, headers)
+        return status, headers, body
+    except Exception as e:
+        print(f"Error handling {req.method} {req.path}: {e}")
+        return _response(500, "Internal Server Error", "text/plain; charset=utf-8")
+    finally:
+        metrics.end_request(token, endpoint, status)
+
+
+# -------- WSGI bridge for the remaining Flask routes --------
+def _wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_LENGTH":
+            continue
+        if key != "CONTENT_TYPE":
+            key = "HTTP_" + key
+        if key in environ:
+            value = f"{environ[key]}{'; ' if key == 'HTTP_COOKIE' else ','}{value}"
+        environ[key] = value
+    return environ
+
+
+def _call_wsgi(scope, body):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(k.lower(), v) for k, v in headers
+                              if k.lower() not in ("content-length", "transfer-encoding")]
+        return lambda data: None
+
+    result = flask_app(_wsgi_environ(scope, body), start_response)
+    try:
+        payload = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return started["status"], started["headers"], payload
+
+
+# -------- ASGI entry point --------
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Write out queued prediction history before the worker exits
+            await asyncio.get_running_loop().run_in_executor(None, db.history_writer.close)
+            aiodb.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    body = await _read_body(receive)
+    route = ROUTES.get((scope["method"], scope["path"])) if _session_interface() is not None else None
+    req = Request(scope, body)
+    if route is not None and not (route[0] == "predict" and req.mimetype != "application/x-www-form-urlencoded"):
+        status, headers, payload = await dispatch(route[0], route[1], req)
+    else:
+        status, headers, payload = await run_sync(_call_wsgi, scope, body)
+    headers.append(("content-length", str(len(payload))))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    await send({"type": "http.response.body", "body": payload})
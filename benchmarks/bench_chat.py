@@ -0,0 +1,74 @@
+# /chat/send throughput: intent matching cost as the keyword base grows (legacy substring scans
+# vs the compiled IntentMatcher), then end-to-end messages/sec through Flask's test client
+#
+#   python benchmarks/bench_chat.py [--messages 20000]
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("MODEL_STRICT", "0")  # chat doesn't need the model
+
+from intents import IntentMatcher, INTENT_KEYWORDS
+
+MESSAGES = [
+    "what should i eat today", "any diet advice?", "how much should i walk",
+    "tips to reduce stress and sleep better", "how to prevent complications", "more",
+    "hello there", "thanks, that was great", "can you help me control my sugar",
+]
+
+
+def legacy_match(intents, text):
+    # The original chain of any(k in text ...) scans
+    for bucket, words in intents:
+        if any(k in text for k in words):
+            return bucket
+    return None
+
+
+def grow(intents, extra, rng):
+    # Pad every bucket with `extra` random keywords that never occur in MESSAGES
+    def word():
+        return "zq" + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+    return tuple((bucket, tuple(words) + tuple(word() for _ in range(extra))) for bucket, words in intents)
+
+
+def per_second(fn, messages):
+    start = time.perf_counter()
+    for text in messages:
+        fn(text)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat intent/throughput benchmark")
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    messages = [rng.choice(MESSAGES) for _ in range(args.messages)]
+
+    print(f"{'keywords':>9} {'legacy msg/s':>14} {'compiled msg/s':>16}")
+    for extra in (0, 100, 1000, 10000):
+        intents = grow(INTENT_KEYWORDS, extra, rng)
+        matcher = IntentMatcher(intents)
+        n_keywords = sum(len(words) for _, words in intents)
+        legacy = per_second(lambda t: legacy_match(intents, t), messages)
+        compiled = per_second(matcher.match, messages)
+        print(f"{n_keywords:>9} {legacy:>14,.0f} {compiled:>16,.0f}")
+
+    import app
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["prediction"] = "Diabetes"
+    n = min(args.messages, 5000)
+    rate = per_second(lambda t: client.post("/chat/send", json={"message": t}), messages[:n])
+    print(f"\n/chat/send end to end: {rate:,.0f} msg/s over {n} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Flat forest engine vs scikit-learn: exactness on processed.csv, single-row and batch latency
+#
+#   python benchmarks/bench_forest_engine.py [--repeat 200]
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import numpy as np
+import pandas as pd
+
+from encoder import encoder
+from features import FEATURES
+from forest_engine import FlatForest
+from model_registry import ModelRegistry
+
+
+def load_processed(path="processed.csv"):
+    # keep_default_na=False: "None" is a real Allergies category, not a missing value
+    df = pd.read_csv(path, index_col=0, keep_default_na=False)
+    return encoder.encode(df[FEATURES].to_numpy(dtype=object))
+
+
+def median_us(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flat forest engine benchmark")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(backend="sklearn").load()
+    model, scaler = registry.get()
+    start = time.perf_counter()
+    engine = FlatForest.from_sklearn(model)
+    print(f"compiled {len(engine.roots)} trees / {len(engine.feature)} nodes "
+          f"in {time.perf_counter() - start:.3f}s")
+
+    Xs = scaler.transform(load_processed())
+    expected, actual = model.predict(Xs), engine.predict(Xs)
+    mismatches = int(np.sum(expected != actual))
+    print(f"processed.csv: {len(Xs)} rows, {mismatches} prediction mismatches")
+    if mismatches:
+        sys.exit(1)
+
+    row = Xs[:1]
+    sk_single = median_us(lambda: model.predict(row), args.repeat)
+    flat_single = median_us(lambda: engine.predict(row), args.repeat)
+    batch_repeat = max(3, args.repeat // 20)
+    sk_batch = median_us(lambda: model.predict(Xs), batch_repeat) / 1000
+    flat_batch = median_us(lambda: engine.predict(Xs), batch_repeat) / 1000
+
+    print(f"single row : sklearn {sk_single:10.1f} us   flat {flat_single:10.1f} us   "
+          f"({sk_single / flat_single:.1f}x)")
+    print(f"batch {len(Xs)}: sklearn {sk_batch:10.1f} ms   flat {flat_batch:10.1f} ms   "
+          f"({sk_batch / flat_batch:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
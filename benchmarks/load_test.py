@@ -0,0 +1,204 @@
+# Concurrent chat-session load test: WSGI (gunicorn sync workers) vs ASGI (gunicorn uvicorn workers)
+#
+#   python benchmarks/load_test.py --spawn wsgi --workers 2
+#   python benchmarks/load_test.py --spawn asgi --workers 2
+#   python benchmarks/load_test.py --url http://127.0.0.1:8000      (an already running server)
+#
+# Every virtual user posts one /predict form to get a session, then sends --messages chat
+# messages on it. Users run concurrently at each --concurrency level. The script reports
+# requests/sec, latency percentiles and errors per level. A level where errors or p99 blow up
+# shows the concurrency the serving mode can't hold. The client is plain asyncio streams.
+# Spawned servers run with RATE_LIMIT=0, since every virtual user shares one IP; pass
+# --rate-limit to keep the limiter on and see 429s (the "limited" column) under the same load.
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURES
+
+CHAT_MESSAGES = [
+    "what should i eat today", "any diet advice?", "how much should i walk",
+    "tips to reduce stress and sleep better", "how to prevent complications", "more",
+]
+
+
+def synthetic_users(n, seed):
+    # Raw /predict form posts for n patients sampled from processed.csv
+    df = pd.read_csv("processed.csv", index_col=0, keep_default_na=False, dtype=str)
+    return df[FEATURES].sample(n=n, replace=True, random_state=seed).to_dict(orient="records")
+
+
+class Connection:
+    # Minimal HTTP/1.1 client connection; reconnects when the server closes keep-alive
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.reader = self.writer = None
+        self.cookie = None
+
+    async def request(self, method, path, body=b"", content_type=None):
+        for attempt in (0, 1):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                    f"Content-Length: {len(body)}"]
+            if content_type:
+                head.append(f"Content-Type: {content_type}")
+            if self.cookie:
+                head.append(f"Cookie: {self.cookie}")
+            self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+            try:
+                return await asyncio.wait_for(self._read_response(), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if attempt:
+                    raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers.setdefault(name.strip().lower(), []).append(value.strip())
+        body = await self.reader.readexactly(int(headers.get("content-length", ["0"])[0]))
+        for cookie in headers.get("set-cookie", []):
+            self.cookie = cookie.split(";", 1)[0]
+        if "close" in headers.get("connection", [""])[0].lower():
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def virtual_user(host, port, form, messages, timeout, latencies, errors, limited):
+    conn = Connection(host, port, timeout)
+    steps = [("POST", "/predict", urlencode(form).encode(), "application/x-www-form-urlencoded")]
+    steps += [("POST", "/chat/send", json.dumps({"message": m}).encode(), "application/json") for m in messages]
+    try:
+        for method, path, body, ctype in steps:
+            start = time.perf_counter()
+            try:
+                status, _ = await conn.request(method, path, body, ctype)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                errors.append(path)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status == 429:
+                limited.append(path)
+            elif status != 200:
+                errors.append(path)
+    finally:
+        conn.close()
+
+
+async def run_level(host, port, concurrency, users, args, rng):
+    latencies, errors, limited = [], [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        virtual_user(host, port, users[i % len(users)], [rng.choice(CHAT_MESSAGES) for _ in range(args.messages)],
+                     args.timeout, latencies, errors, limited)
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    ms = np.asarray(latencies or [0.0]) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "limited": len(limited),
+        "requests_per_sec": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "elapsed_s": elapsed,
+    }
+
+
+def wait_for_port(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not start listening on {host}:{port}")
+
+
+def spawn(mode, port, workers, rate_limit=False):
+    if mode == "wsgi":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers),
+               "-b", f"127.0.0.1:{port}", "app:app"]
+    else:
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers),
+               "-k", "uvicorn.workers.UvicornWorker", "-b", f"127.0.0.1:{port}", "asgi:app"]
+    env = dict(os.environ, RATE_LIMIT="1" if rate_limit else "0")
+    return subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent chat-session load test, WSGI vs ASGI")
+    parser.add_argument("--url", help="base URL of a running server")
+    parser.add_argument("--spawn", choices=("wsgi", "asgi"), help="start the server in this mode")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", default="1,10,50,200", help="comma-separated user counts")
+    parser.add_argument("--messages", type=int, default=20, help="chat messages per user")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout (seconds)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the spawned server's rate limiter on")
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+    if not args.url and not args.spawn:
+        parser.error("give --url or --spawn")
+
+    server = None
+    if args.spawn:
+        host, port = "127.0.0.1", args.port
+        server = spawn(args.spawn, port, args.workers, args.rate_limit)
+    else:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    try:
+        wait_for_port(host, port)
+        levels = [int(c) for c in args.concurrency.split(",")]
+        users = synthetic_users(max(levels), args.seed)
+        rng = random.Random(args.seed)
+        results = []
+        print(f"{'users':>6} {'requests':>9} {'errors':>7} {'limited':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for level in levels:
+            r = asyncio.run(run_level(host, port, level, users, args, rng))
+            results.append(r)
+            print(f"{r['concurrency']:>6} {r['requests']:>9} {r['errors']:>7} {r['limited']:>8} {r['requests_per_sec']:>9.0f} "
+                  f"{r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"mode": args.spawn or args.url, "workers": args.workers, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Per-worker memory with the model shared from a pre-fork master vs loaded in every worker
+#
+#   python benchmarks/measure_worker_rss.py --workers 4
+#
+# Linux only (reads /proc/<pid>/smaps_rollup). "shared" mirrors gunicorn with SHARED_MODEL=1:
+# the parent loads the model, freezes the GC and forks; "per-worker" forks first and loads in
+# each child. Each worker then runs a few predictions, as it would while serving, and reports
+# RSS, PSS (RSS with shared pages split between sharers) and its shared/private split.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from features import FEATURES
+from model_registry import ModelRegistry
+
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def memory_kb(pid):
+    stats = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in FIELDS:
+                stats[key] = int(rest.split()[0])
+    return stats
+
+
+def worker(registry, shared, ready_w, go_r):
+    if not shared:
+        registry.load()
+    model, scaler = registry.get()
+    X = np.random.default_rng(os.getpid()).normal(size=(32, len(FEATURES)))
+    for _ in range(5):
+        model.predict(scaler.transform(X))
+    os.write(ready_w, b"1")
+    os.read(go_r, 1)  # stay alive until the parent has sampled everyone
+    os._exit(0)
+
+
+def run(mode, n_workers, mmap):
+    registry = ModelRegistry(mmap=mmap)
+    shared = mode == "shared"
+    if shared:
+        registry.prepare_for_fork()
+    ready_r, ready_w = os.pipe()
+    go_r, go_w = os.pipe()
+    pids = []
+    for _ in range(n_workers):
+        pid = os.fork()
+        if pid == 0:
+            worker(registry, shared, ready_w, go_r)
+        pids.append(pid)
+    for _ in pids:
+        os.read(ready_r, 1)
+    time.sleep(0.2)
+    stats = [memory_kb(pid) for pid in pids]
+    os.write(go_w, b"x" * len(pids))
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-worker RSS with shared vs per-worker model loading")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mmap", action="store_true", help="load artifacts with joblib mmap_mode='r'")
+    args = parser.parse_args()
+
+    for mode in ("per-worker", "shared"):
+        stats = run(mode, args.workers, args.mmap)
+        print(f"\n== {mode} ({args.workers} workers{', mmap' if args.mmap else ''}) ==")
+        print("  worker " + " ".join(f"{k:>14}" for k in FIELDS) + "   (MiB)")
+        for i, s in enumerate(stats):
+            print(f"  {i:>6} " + " ".join(f"{s.get(k, 0) / 1024:14.1f}" for k in FIELDS))
+        total_pss = sum(s.get("Pss", 0) for s in stats) / 1024
+        print(f"  total PSS across workers: {total_pss:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# Performance baseline for the request hot paths, written as JSON so runs can be compared
+#
+#   python benchmarks/suite.py --output baseline.json
+#   python benchmarks/suite.py --output after.json --baseline baseline.json [--tolerance 0.15]
+#
+# Drives the app through Flask's test client with synthetic users drawn from processed.csv,
+# against a throwaway signup database and in-memory sessions. Measures /predict latency
+# percentiles (cache cold and warm), /chat/send throughput, /history page time as the stored
+# record count grows, and encrypt/decrypt_prediction_data on their own. With --baseline, every
+# metric that got worse by more than --tolerance is listed and the exit status is 1.
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+_TMP = tempfile.mkdtemp(prefix="bench-suite-")
+os.environ["SIGNUP_DB"] = os.path.join(_TMP, "signup.db")
+os.environ["SESSION_BACKEND"] = "memory"
+os.environ.pop("PREDICTION_CACHE_DB", None)
+# Every request comes from the same test client; time the handlers, not the rate limiter
+os.environ["RATE_LIMIT"] = "0"
+
+import numpy as np
+import pandas as pd
+
+from encoder import encoder
+from features import FEATURES
+
+CHAT_MESSAGES = [
+    "what should i eat today", "any diet advice?", "how much should i walk",
+    "tips to reduce stress and sleep better", "how to prevent complications", "more",
+    "hello there", "can you help me control my sugar",
+]
+HISTORY_COUNTS = (10, 100, 1000, 10000)
+
+
+def percentiles_ms(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def timed(fn, n):
+    samples = []
+    for i in range(n):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def synthetic_users(n, seed):
+    # Raw form posts (category names as in processed.csv) for n patients sampled with replacement
+    df = pd.read_csv("processed.csv", index_col=0, keep_default_na=False, dtype=str)
+    sample = df[FEATURES].sample(n=n, replace=True, random_state=seed)
+    return sample.to_dict(orient="records")
+
+
+def login(client, username):
+    with client.session_transaction() as sess:
+        sess["username"] = username
+
+
+def bench_predict(app_module, users):
+    client = app_module.app.test_client()
+    login(client, "bench_predict")
+    client.get("/predict")  # first-request setup is not part of the steady state
+
+    def post(i):
+        r = client.post("/predict", data=users[i])
+        assert r.status_code == 200, r.status_code
+
+    cold = timed(post, len(users))
+    warm = timed(post, len(users))  # same users again: served from the prediction cache
+    app_module.db.history_writer.flush(timeout=30)
+    return {"requests": len(users), "cold": percentiles_ms(cold), "warm": percentiles_ms(warm)}
+
+
+def bench_chat(app_module, n, rng):
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess["prediction"] = "Diabetes"
+    messages = [rng.choice(CHAT_MESSAGES) for _ in range(n)]
+    samples = timed(lambda i: client.post("/chat/send", json={"message": messages[i]}), n)
+    return {"messages": n, "msgs_per_sec": n / sum(samples), **percentiles_ms(samples)}
+
+
+def encoded_inputs(users):
+    # The inputs dicts /predict stores in history, one per user
+    X = encoder.encode([[u[f] for f in FEATURES] for u in users])
+    return [dict(zip(FEATURES, row)) for row in X.tolist()]
+
+
+def bench_history(app_module, inputs, repeat):
+    # Records are encrypted once and inserted directly; each size gets its own user
+    from encryption import encrypt_prediction_data
+    db = app_module.db
+    results = {}
+    for count in HISTORY_COUNTS:
+        username = f"bench_history_{count}"
+        blobs = [encrypt_prediction_data(username, inputs[i % len(inputs)], "None") for i in range(count)]
+        with db.pool.connection() as con:
+            con.executemany(db.SQL_INSERT_HISTORY, [(username, b) for b in blobs])
+        client = app_module.app.test_client()
+        login(client, username)
+        first_page = timed(lambda i: client.get("/history"), repeat)
+        results[str(count)] = {"first_page": percentiles_ms(first_page)}
+    return results
+
+
+def bench_encryption(inputs, n):
+    from encryption import encrypt_prediction_data, decrypt_prediction_data
+    encrypt_prediction_data("bench_crypto", inputs, "None")  # cipher context cached from here on
+    start = time.perf_counter()
+    blobs = [encrypt_prediction_data("bench_crypto", inputs, "None") for _ in range(n)]
+    enc = time.perf_counter() - start
+    start = time.perf_counter()
+    for b in blobs:
+        decrypt_prediction_data("bench_crypto", b)
+    dec = time.perf_counter() - start
+    return {"records": n, "encrypt_us": enc / n * 1e6, "decrypt_us": dec / n * 1e6}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def flatten(tree, prefix=""):
+    out = {}
+    for key, value in tree.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, name + "."))
+        elif isinstance(value, float):
+            out[name] = value
+    return out
+
+
+def regressions(current, baseline, tolerance):
+    # Throughput metrics (per_sec) should not drop, everything timed (_ms/_us) should not grow.
+    # max_ms is a single sample and too noisy to gate on.
+    found = []
+    old = flatten(baseline)
+    for name, value in flatten(current).items():
+        before = old.get(name)
+        if not before or name.endswith("max_ms"):
+            continue
+        change = (value - before) / before
+        worse = -change if name.endswith("per_sec") else change
+        if worse > tolerance:
+            found.append((name, before, value, change))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prediction/chat/history/encryption benchmark suite")
+    parser.add_argument("--users", type=int, default=500, help="/predict requests per pass")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--history-repeat", type=int, default=20)
+    parser.add_argument("--records", type=int, default=2000, help="records for the encryption timings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="-", help="JSON file to write (default: stdout)")
+    parser.add_argument("--baseline", help="earlier JSON result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    import app as app_module
+    users = synthetic_users(args.users, args.seed)
+    inputs = encoded_inputs(users)
+    rng = random.Random(args.seed)
+
+    results = {}
+    for name, run in (
+        ("predict", lambda: bench_predict(app_module, users)),
+        ("chat", lambda: bench_chat(app_module, args.messages, rng)),
+        ("history", lambda: bench_history(app_module, inputs, args.history_repeat)),
+        ("encryption", lambda: bench_encryption(inputs[0], args.records)),
+    ):
+        print(f"running {name}...", file=sys.stderr)
+        results[name] = run()
+
+    report = {"environment": environment(), "model": app_module.registry.status(),
+              "args": vars(args), "results": results}
+    text = json.dumps(report, indent=2, default=str)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"wrote {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        found = regressions(results, baseline, args.tolerance)
+        for name, before, after, change in found:
+            print(f"REGRESSION {name}: {before:.3f} -> {after:.3f} ({change:+.0%})", file=sys.stderr)
+        if found:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# Shared SQLite data-access layer for signup.db (pooled WAL connections + background history writer)
+import os
+import queue
+import sqlite3
+import threading
+import time
+import atexit
+from contextlib import contextmanager
+
+from encryption import encrypt_prediction_data
+from metrics import metrics
+
+DB_PATH = os.environ.get("SIGNUP_DB", "signup.db")
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+WRITE_QUEUE_SIZE = int(os.environ.get("DB_WRITE_QUEUE_SIZE", "1024"))
+WRITE_BATCH_SIZE = int(os.environ.get("DB_WRITE_BATCH_SIZE", "64"))
+WRITE_LINGER_SECONDS = float(os.environ.get("DB_WRITE_LINGER_MS", "20")) / 1000.0
+# What a request does when the history queue is full: "block" (wait DB_WRITE_BLOCK_MS, then
+# write inline), "inline" (write inline at once) or "drop" (discard the record, log a warning)
+WRITE_BACKPRESSURE = os.environ.get("DB_WRITE_BACKPRESSURE", "block")
+WRITE_BLOCK_SECONDS = float(os.environ.get("DB_WRITE_BLOCK_MS", "1000")) / 1000.0
+WRITE_RETRIES = int(os.environ.get("DB_WRITE_RETRIES", "3"))
+WRITE_SHUTDOWN_SECONDS = float(os.environ.get("DB_WRITE_SHUTDOWN_SECONDS", "10"))
+
+# Statements are kept as module constants so every pooled connection hits its own
+# prepared-statement cache instead of re-parsing the SQL on each request.
+SQL_USER_EXISTS = "SELECT 1 FROM info WHERE user = ?"
+SQL_INSERT_USER = "INSERT INTO `info` (`user`, `name`, `email`, `mobile`, `password`) VALUES (?, ?, ?, ?, ?)"
+SQL_CHECK_CREDENTIALS = "SELECT `user`, `password` FROM info WHERE `user` = ? AND `password` = ?"
+SQL_INSERT_HISTORY = "INSERT INTO prediction_history (username, encrypted_data) VALUES (?, ?)"
+# Both page queries walk idx_history_user_created_id (username, created_at DESC, id DESC) in
+# order. Newest first, with id breaking ties: created_at has one-second resolution and the
+# history writer commits whole batches within the same second. `created_at <= ?` bounds the
+# index range so a deep page seeks to the cursor instead of scanning every newer row.
+SQL_SELECT_HISTORY_FIRST = '''
+    SELECT id, encrypted_data, created_at
+    FROM prediction_history
+    WHERE username = ?
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+'''
+SQL_SELECT_HISTORY_AFTER = '''
+    SELECT id, encrypted_data, created_at
+    FROM prediction_history
+    WHERE username = ? AND created_at <= ? AND (created_at < ? OR id < ?)
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+'''
+
+
+def _open_connection(path):
+    con = sqlite3.connect(path, timeout=30, check_same_thread=False, cached_statements=256)
+    con.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL only fsyncs at checkpoints, which is safe against corruption
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA busy_timeout=30000")
+    return con
+
+
+class ConnectionPool:
+    # Fixed-size pool of long-lived connections shared by request threads
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return _open_connection(self.path)
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        # Borrow a connection; commits on success and rolls back on error
+        con = self._acquire()
+        try:
+            yield con
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        finally:
+            self._idle.put(con)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class HistoryWriter:
+    # Owns prediction history persistence: requests only enqueue (username, inputs, prediction);
+    # a background thread encrypts each record and commits them in shared transactions
+
+    def __init__(self, path, maxsize=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE,
+                 linger=WRITE_LINGER_SECONDS, backpressure=WRITE_BACKPRESSURE,
+                 block_timeout=WRITE_BLOCK_SECONDS, retries=WRITE_RETRIES):
+        if backpressure not in ("block", "inline", "drop"):
+            raise ValueError(f"Unknown DB_WRITE_BACKPRESSURE {backpressure!r}")
+        self.path = path
+        self.batch_size = batch_size
+        self.linger = linger
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+        self.retries = retries
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        # username -> records queued but not yet committed, so a reader waits only for its own
+        self._pending_by_user = {}
+        self._idle = threading.Condition()
+        self.counters = {"written": 0, "retried": 0, "failed": 0, "dropped": 0, "inline": 0}
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, username, inputs, prediction, probabilities=None, explanation=None):
+        # Enqueue a record. When the queue is full: "block" waits up to block_timeout and then
+        # writes inline, "inline" writes inline at once, "drop" discards the record.
+        self._ensure_started()
+        item = (username, inputs, prediction, probabilities, explanation)
+        with self._idle:
+            self._pending += 1
+            self._pending_by_user[username] = self._pending_by_user.get(username, 0) + 1
+        try:
+            if self.backpressure == "block":
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            self._done([username])
+        if self.backpressure == "drop":
+            self.counters["dropped"] += 1
+            print(f"[WARN] History queue full, dropped a record for {username}")
+            return
+        self.counters["inline"] += 1
+        rows = self._encrypt([item])
+        with pool.connection() as con:
+            con.executemany(SQL_INSERT_HISTORY, rows)
+
+    def _done(self, usernames):
+        with self._idle:
+            self._pending -= len(usernames)
+            for username in usernames:
+                left = self._pending_by_user.get(username, 0) - 1
+                if left > 0:
+                    self._pending_by_user[username] = left
+                else:
+                    self._pending_by_user.pop(username, None)
+            self._idle.notify_all()
+
+    def flush(self, username=None, timeout=None):
+        # Wait until everything queued so far (or only `username`'s records) has been committed
+        # or given up on; returns at once when there is nothing to wait for
+        with self._idle:
+            if username is None:
+                return self._idle.wait_for(lambda: self._pending <= 0, timeout)
+            return self._idle.wait_for(lambda: username not in self._pending_by_user, timeout)
+
+    def close(self, timeout=WRITE_SHUTDOWN_SECONDS):
+        # Write out what is still queued, then stop the thread
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            print(f"[WARN] History writer did not drain before shutdown, {self._pending} records lost")
+            return
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {**self.counters, "queued": self._queue.qsize(), "backpressure": self.backpressure}
+
+    def _drain(self, first):
+        batch = [first]
+        stop = False
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=self.linger)
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _encrypt(self, batch):
+        # Records that fail to encrypt are reported and skipped
+        rows = []
+        with metrics.span("history.encrypt"):
+            for username, inputs, prediction, probabilities, explanation in batch:
+                try:
+                    rows.append((username, encrypt_prediction_data(username, inputs, prediction,
+                                                                   probabilities, explanation)))
+                except Exception as e:
+                    self.counters["failed"] += 1
+                    print(f"Error encrypting prediction history for {username}: {e}")
+        return rows
+
+    def _write(self, con, rows):
+        # Busy/locked databases are retried with backoff; once retries run out the rows are
+        # tried one by one so a single bad row doesn't take the whole batch with it
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.span("history.write"), con:
+                    con.executemany(SQL_INSERT_HISTORY, rows)
+                self.counters["written"] += len(rows)
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == self.retries:
+                    print(f"Error saving prediction history after {attempt + 1} attempts: {e}")
+                    break
+                self.counters["retried"] += 1
+                time.sleep(0.05 * 2 ** attempt)
+            except sqlite3.Error as e:
+                print(f"Error saving prediction history: {e}")
+                break
+        for row in rows:
+            try:
+                with con:
+                    con.execute(SQL_INSERT_HISTORY, row)
+                self.counters["written"] += 1
+            except sqlite3.Error as e:
+                self.counters["failed"] += 1
+                print(f"Error saving prediction history for {row[0]}: {e}")
+
+    def _run(self):
+        con = _open_connection(self.path)
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    return
+                batch, stop = self._drain(first)
+                try:
+                    rows = self._encrypt(batch)
+                    if rows:
+                        self._write(con, rows)
+                except Exception as e:
+                    print(f"Error saving prediction history: {e}")
+                finally:
+                    self._done([item[0] for item in batch])
+                if stop:
+                    return
+        finally:
+            con.close()
+
+
+pool = ConnectionPool(DB_PATH)
+history_writer = HistoryWriter(DB_PATH)
+atexit.register(lambda: history_writer.close())
+
+
+def _reset_after_fork():
+    # SQLite handles and the writer thread must not be shared with a pre-forking master
+    global pool, history_writer
+    pool = ConnectionPool(DB_PATH)
+    history_writer = HistoryWriter(DB_PATH)
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# -------- Queries --------
+def user_exists(username):
+    with pool.connection() as con:
+        return con.execute(SQL_USER_EXISTS, (username,)).fetchone() is not None
+
+
+def create_user(username, name, email, mobile, password):
+    with pool.connection() as con:
+        con.execute(SQL_INSERT_USER, (username, name, email, mobile, password))
+
+
+def check_credentials(username, password):
+    with pool.connection() as con:
+        return con.execute(SQL_CHECK_CREDENTIALS, (username, password)).fetchone()
+
+
+def save_history(username, inputs, prediction, probabilities=None, explanation=None):
+    # Encrypted and committed by the background writer; returns as soon as it is queued
+    history_writer.submit(username, inputs, prediction, probabilities, explanation)
+
+
+def fetch_history_page(username, limit, after=None):
+    # Keyset page: `after` is the (created_at, id) of the last row already shown
+    # Only this user's queued predictions need to be visible; other users' writes (or a
+    # writer retrying a locked database for them) don't hold the page up
+    history_writer.flush(username, timeout=5.0)
+    with pool.connection() as con:
+        if after is None:
+            return con.execute(SQL_SELECT_HISTORY_FIRST, (username, limit)).fetchall()
+        created_at, record_id = after
+        return con.execute(SQL_SELECT_HISTORY_AFTER,
+                           (username, created_at, created_at, record_id, limit)).fetchall()
@@ -0,0 +1,154 @@
+# Diet-plan lookup for /predict: macro targets and meal-plan type from
+# Personalized_Diet_Recommendations.csv, precomputed per (disease, BMI band, activity band,
+# calorie-intake band) cell. The table is a small float32 array saved under Models/ and
+# memory-mapped on load, so a request is a few bisects and one array index; no pandas or model.
+# Cells with fewer than DIET_MIN_CELL patients fall back to the disease-wide plan (or, for a
+# disease missing from the data, the plan across all patients); the table records which.
+# Build it at deploy time (it is also built on first use if missing or stale):
+#
+#   python diet_plans.py
+import csv
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter
+
+import numpy as np
+
+from artifacts import atomic_write, file_hash
+from features import FEATURES, LABELS, MACRO_COLUMNS, MACRO_KEYS
+from model_registry import MODELS_DIR
+
+DIET_DATA = os.environ.get("DIET_DATA", "Personalized_Diet_Recommendations.csv")
+DIET_TABLE = os.environ.get("DIET_TABLE", os.path.join(MODELS_DIR, "diet_plans.npy"))
+DIET_MIN_CELL = int(os.environ.get("DIET_MIN_CELL", "5"))
+
+# Band edges (right-open) and their display names, per input column
+BINS = {
+    "BMI": ((18.5, 25.0, 30.0), ("underweight", "normal", "overweight", "obese")),
+    "Daily_Steps": ((5000, 10000), ("low", "moderate", "high")),
+    "Caloric_Intake": ((1800, 2500), ("low", "moderate", "high")),
+}
+BIN_COLUMNS = tuple(FEATURES.index(c) for c in BINS)
+# Last axis of the table: the macros, the meal-plan code, the number of patients the plan was
+# computed from, the number of patients in the cell itself, and the plan's SCOPES index
+PLAN, COUNT, BAND_COUNT, SCOPE = range(len(MACRO_KEYS), len(MACRO_KEYS) + 4)
+SCOPES = ("band", "disease", "all")
+# Bumped when the table layout changes, so saved tables are rebuilt
+TABLE_VERSION = 2
+
+
+def _band(value, edges):
+    return bisect_right(edges, value)
+
+
+class DietPlans:
+
+    def __init__(self, data_path=DIET_DATA, table_path=DIET_TABLE, min_cell=DIET_MIN_CELL):
+        self.data_path = data_path
+        self.table_path = table_path
+        # Meal-plan names and the source hash live next to the array
+        self.meta_path = os.path.splitext(table_path)[0] + ".json"
+        self.min_cell = min_cell
+        self.table = None
+        self.meal_plans = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        # -> (table, meta) without saving
+        with open(self.data_path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        plans = sorted({r["Recommended_Meal_Plan"] for r in rows})
+        plan_codes = {p: i for i, p in enumerate(plans)}
+        shape = (len(LABELS),) + tuple(len(names) for _, names in BINS.values())
+        cells, by_disease = {}, {}
+        for r in rows:
+            if r["Chronic_Disease"] not in LABELS:
+                continue
+            d = LABELS.index(r["Chronic_Disease"])
+            cell = (d,) + tuple(_band(float(r[c]), edges) for c, (edges, _) in BINS.items())
+            entry = ([float(r[c]) for c in MACRO_COLUMNS], plan_codes[r["Recommended_Meal_Plan"]])
+            cells.setdefault(cell, []).append(entry)
+            by_disease.setdefault(d, []).append(entry)
+
+        def summarize(entries):
+            macros = np.median([m for m, _ in entries], axis=0)
+            plan = Counter(p for _, p in entries).most_common(1)[0][0]
+            return list(macros) + [plan, len(entries)]
+
+        table = np.zeros(shape + (SCOPE + 1,), dtype=np.float32)
+        pooled = {d: summarize(entries) for d, entries in by_disease.items()}
+        overall = summarize([e for entries in by_disease.values() for e in entries])
+        for cell in np.ndindex(*shape):
+            entries = cells.get(cell, [])
+            if len(entries) >= self.min_cell:
+                plan, scope = summarize(entries), 0
+            elif cell[0] in pooled:
+                plan, scope = pooled[cell[0]], 1
+            else:
+                plan, scope = overall, 2
+            table[cell] = plan + [len(entries), scope]
+        meta = {"key": file_hash(self.data_path), "meal_plans": plans, "min_cell": self.min_cell,
+                "version": TABLE_VERSION}
+        return table, meta
+
+    def save(self, table, meta):
+        # Both files are replaced atomically, table first: workers map the old table, and
+        # truncating it in place would crash them
+        atomic_write(self.table_path, lambda f: np.save(f, table))
+        atomic_write(self.meta_path, lambda f: json.dump(meta, f), mode="w")
+
+    def load(self, rebuild=False):
+        # Idempotent; reuses the saved table when it matches the current CSV
+        if self.table is not None and not rebuild:
+            return self
+        with self._lock:
+            if self.table is not None and not rebuild:
+                return self
+            table = meta = None
+            if not rebuild and os.path.exists(self.table_path) and os.path.exists(self.meta_path):
+                try:
+                    with open(self.meta_path) as f:
+                        meta = json.load(f)
+                    if (meta.get("key") == file_hash(self.data_path) and meta.get("min_cell") == self.min_cell
+                            and meta.get("version") == TABLE_VERSION):
+                        table = np.load(self.table_path, mmap_mode="r")
+                except (OSError, ValueError) as e:
+                    print(f"[WARN] Rebuilding diet-plan table, could not read {self.table_path}: {e}")
+                    table = None
+            if table is None:
+                table, meta = self.build()
+                try:
+                    self.save(table, meta)
+                except OSError as e:
+                    print(f"[WARN] Could not save diet-plan table to {self.table_path}: {e}")
+            self.meal_plans = meta["meal_plans"]
+            self.table = table
+            return self
+
+    def lookup(self, disease, vals):
+        # disease: predicted label; vals: one encoded row in FEATURES order -> plan dict
+        self.load()
+        bands = tuple(_band(vals[i], edges) for i, (edges, _) in zip(BIN_COLUMNS, BINS.values()))
+        d = LABELS.index(disease) if disease in LABELS else LABELS.index("None")
+        cell = self.table[(d,) + bands].tolist()
+        return {
+            "meal_plan": self.meal_plans[int(cell[PLAN])],
+            **{key: int(round(v)) for key, v in zip(MACRO_KEYS, cell[:PLAN])},
+            "cohort_size": int(cell[COUNT]),
+            "band_size": int(cell[BAND_COUNT]),
+            # "band": from the patients in this cell; "disease"/"all": pooled, the cell is too small
+            "scope": SCOPES[int(cell[SCOPE])],
+            "bands": {c.lower(): names[b] for (c, (_, names)), b in zip(BINS.items(), bands)},
+        }
+
+
+diet_plans = DietPlans()
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    diet_plans.load(rebuild=True)
+    print(f"wrote {diet_plans.table.shape} diet-plan table to {DIET_TABLE} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,150 @@
+# Raw inputs -> model vectors in FEATURES order, shared by /predict, /predict/batch and the offline
+# tools. Categorical fields accept the category name ("Female") or its training code ("0", 0);
+# numeric fields anything float() accepts. A whole batch is parsed, looked up and range-checked
+# with array operations; cells are only walked one by one to explain a failure.
+import numpy as np
+
+from features import FEATURES, CATEGORIES
+
+# Plausible bounds per numeric field; values outside are almost certainly typos or unit mix-ups
+RANGES = {
+    'Age': (0, 120),
+    'Height_cm': (50, 250),
+    'Weight_kg': (10, 350),
+    'BMI': (5, 100),
+    'Blood_Pressure_Systolic': (50, 260),
+    'Blood_Pressure_Diastolic': (30, 180),
+    'Cholesterol_Level': (50, 600),
+    'Blood_Sugar_Level': (20, 700),
+    'Daily_Steps': (0, 100000),
+    'Exercise_Frequency': (0, 14),
+    'Sleep_Hours': (0, 24),
+    'Caloric_Intake': (0, 10000),
+    'Protein_Intake': (0, 1000),
+    'Carbohydrate_Intake': (0, 2000),
+    'Fat_Intake': (0, 1000),
+}
+
+
+class EncodeError(ValueError):
+    # .errors: [{"row", "feature", "error"}, ...] in row, then FEATURES order
+
+    def __init__(self, errors):
+        super().__init__(errors[0]["error"] if errors else "Invalid input")
+        self.errors = errors
+
+
+class FeatureEncoder:
+
+    def __init__(self, features=FEATURES, categories=CATEGORIES, ranges=RANGES):
+        self.features = list(features)
+        self.cat_idx = np.array([j for j, f in enumerate(self.features) if f in categories], dtype=np.intp)
+        self.num_idx = np.array([j for j, f in enumerate(self.features) if f not in categories], dtype=np.intp)
+        # Lookup tables keyed by the stripped text of a cell: name, "code" and "code.0"
+        self._lookups = []
+        for j in self.cat_idx:
+            lut = {}
+            for code, name in enumerate(categories[self.features[j]]):
+                lut[name] = lut[str(code)] = lut[f"{code}.0"] = float(code)
+            self._lookups.append(lut)
+        inf = float("inf")
+        self._lo = np.array([ranges.get(f, (-inf, inf))[0] for f in self.features], dtype=float)
+        self._hi = np.array([ranges.get(f, (-inf, inf))[1] for f in self.features], dtype=float)
+
+    def _parse(self, rows):
+        # Returns (X, problems): X is NaN wherever a cell could not be encoded, problems is an
+        # int8 matrix (0 ok, 1 missing, 2 not a number, 3 unknown category, 4 out of range)
+        cells = np.empty((len(rows), len(self.features)), dtype=object)
+        try:
+            cells[:] = rows
+        except (TypeError, ValueError):
+            # Cells holding lists (e.g. from JSON) can defeat the bulk copy; store them one by
+            # one so they are reported as invalid cells instead of failing the request
+            for i, row in enumerate(rows):
+                for j, v in enumerate(row):
+                    cells[i, j] = v
+        X = np.full(cells.shape, np.nan)
+        missing = np.zeros(cells.shape, dtype=bool)
+        problems = np.zeros(cells.shape, dtype=np.int8)
+
+        # Categorical columns: look up each distinct stripped value once
+        cats = cells[:, self.cat_idx]
+        text = _stripped_text(cats)
+        missing[:, self.cat_idx] = np.equal(cats, None) | (text == "")
+        for k, j in enumerate(self.cat_idx):
+            uniques, inverse = np.unique(text[:, k], return_inverse=True)
+            lut = self._lookups[k]
+            X[:, j] = np.array([lut.get(u, np.nan) for u in uniques])[inverse.reshape(-1)]
+            problems[np.isnan(X[:, j]), j] = 3
+
+        # Numeric columns: one float conversion for the whole block; a column only gets a
+        # closer look when it contains something float() rejects
+        try:
+            X[:, self.num_idx] = cells[:, self.num_idx].astype(float)
+        except (TypeError, ValueError):
+            for j in self.num_idx:
+                col = cells[:, j]
+                try:
+                    X[:, j] = col.astype(float)
+                except (TypeError, ValueError):
+                    X[:, j] = [_to_float(v) for v in col]
+        # NaN here is missing (None, blank) or unparsable; tell them apart only where it occurs
+        for j in self.num_idx[~np.isfinite(X[:, self.num_idx]).all(axis=0)]:
+            col = cells[:, j]
+            missing[:, j] = np.equal(col, None) | (_stripped_text(col) == "")
+        problems[:, self.num_idx] = np.where(np.isfinite(X[:, self.num_idx]), 0, 2)
+        problems[(X < self._lo) | (X > self._hi)] = 4
+        problems[missing] = 1
+        return X, problems
+
+    def encode(self, rows):
+        # rows: sequence of sequences in FEATURES order -> float array (n, len(features));
+        # raises EncodeError listing every bad cell
+        X, problems = self._parse(rows)
+        if problems.any():
+            raise EncodeError(self._explain(problems))
+        return X
+
+    def encode_one(self, mapping):
+        # A single record keyed by feature name (request.form, a JSON object) -> shape (1, n)
+        return self.encode([[mapping.get(f) for f in self.features]])
+
+    def encode_valid(self, rows):
+        # Offline variant: (X, valid) where invalid rows are flagged instead of raising
+        X, problems = self._parse(rows)
+        return X, ~problems.any(axis=1)
+
+    def _explain(self, problems):
+        errors = []
+        for i, j in np.argwhere(problems):
+            f = self.features[j]
+            kind = problems[i, j]
+            if kind == 1:
+                msg = f"Missing value for {f}"
+            elif kind == 2:
+                msg = f"Invalid numeric value for {f}"
+            elif kind == 3:
+                msg = f"Unknown category for {f}"
+            else:
+                msg = f"{f} out of range ({self._lo[j]:g}-{self._hi[j]:g})"
+            errors.append({"row": int(i), "feature": f, "error": msg})
+        return errors
+
+
+def _stripped_text(cells):
+    # str() of every cell, stripped. astype(str) rejects list cells; those take the slow path
+    # and keep their repr, which matches no category (and float() rejects the list itself).
+    try:
+        return np.char.strip(cells.astype(str))
+    except ValueError:
+        return np.char.strip(np.vectorize(str, otypes=[str])(cells))
+
+
+def _to_float(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+encoder = FeatureEncoder()
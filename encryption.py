@@ -1,9 +1,36 @@
 # AES 256 Encryption Module for storing prediction history securely
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import os
 import base64
 import json
+import struct
+import threading
+import time
+from features import FEATURES, LABELS
+
+# Per-user cipher contexts are cached so key derivation and AESGCM setup happen once per user
+CIPHER_CACHE_SIZE = int(os.environ.get("CIPHER_CACHE_SIZE", "256"))
+CIPHER_CACHE_TTL = float(os.environ.get("CIPHER_CACHE_TTL", "300"))
+
+# Bulk decryption fans out to threads; AES-GCM in `cryptography` releases the GIL
+DECRYPT_WORKERS = int(os.environ.get("DECRYPT_WORKERS", str(os.cpu_count() or 4)))
+DECRYPT_CHUNK_SIZE = int(os.environ.get("DECRYPT_CHUNK_SIZE", "256"))
+
+# Compact record format (stored as a BLOB):
+#   version byte | 12-byte nonce | AES-GCM(float32 x 21 in FEATURES order + label index byte)
+# Version 2 appends the class probabilities (float32 x len(LABELS) in LABELS order), a count
+# byte and that many (feature index byte, float32 contribution) explanation pairs.
+# The version byte is authenticated as associated data. Legacy rows are base64 TEXT holding JSON.
+RECORD_FORMAT_COMPACT = 1
+RECORD_FORMAT_EXPLAINED = 2
+_COMPACT_HEADER = bytes([RECORD_FORMAT_COMPACT])
+_EXPLAINED_HEADER = bytes([RECORD_FORMAT_EXPLAINED])
+_COMPACT_STRUCT = struct.Struct(f"<{len(FEATURES)}fB")
+_PROBA_STRUCT = struct.Struct(f"<{len(LABELS)}fB")
+_FACTOR_STRUCT = struct.Struct("<Bf")
 
 class AES256Encryption:
     # AES 256 GCM encryption class for encrypting and decrypting prediction data
@@ -14,6 +41,7 @@ class AES256Encryption:
 
         self.key = self._derive_key(username)
         self.backend = default_backend()
+        self.aesgcm = AESGCM(self.key)
     
     def _derive_key(self, username):
         
@@ -35,11 +63,8 @@ class AES256Encryption:
         # Generate a random nonce (12 bytes for GCM)
         nonce = os.urandom(12)
         
-        # Create AESGCM cipher
-        aesgcm = AESGCM(self.key)
-        
         # Encrypt the data
-        ciphertext = aesgcm.encrypt(nonce, data_str.encode('utf-8'), None)
+        ciphertext = self.aesgcm.encrypt(nonce, data_str.encode('utf-8'), None)
         
         # Combine nonce and ciphertext, then base64 encode
         encrypted_data = nonce + ciphertext
@@ -47,8 +72,48 @@ class AES256Encryption:
         
         return encoded_data
     
+    def encrypt_record(self, inputs_dict, prediction, probabilities=None, explanation=None):
+        # Encrypt one prediction in the compact binary format (returns bytes for a BLOB column);
+        # with probabilities (a {label: p} dict) the record uses format 2
+        payload = _COMPACT_STRUCT.pack(*[float(inputs_dict[f]) for f in FEATURES],
+                                       LABELS.index(prediction))
+        header = _COMPACT_HEADER
+        if probabilities:
+            factors = explanation or []
+            payload += _PROBA_STRUCT.pack(*[float(probabilities.get(label, 0.0)) for label in LABELS], len(factors))
+            payload += b"".join(_FACTOR_STRUCT.pack(FEATURES.index(f["feature"]), float(f["contribution"]))
+                                for f in factors)
+            header = _EXPLAINED_HEADER
+        nonce = os.urandom(12)
+        return header + nonce + self.aesgcm.encrypt(nonce, payload, header)
+
+    def _decrypt_compact(self, blob):
+        header = blob[:1]
+        if header not in (_COMPACT_HEADER, _EXPLAINED_HEADER):
+            raise ValueError(f"unknown record format {blob[:1].hex()}")
+        payload = self.aesgcm.decrypt(blob[1:13], blob[13:], header)
+        values = _COMPACT_STRUCT.unpack_from(payload)
+        # float32 keeps ~7 significant digits; print at that precision to drop float32 noise
+        inputs = {f: float(f"{v:.7g}") for f, v in zip(FEATURES, values)}
+        record = {'inputs': inputs, 'prediction': LABELS[values[-1]]}
+        if header == _EXPLAINED_HEADER:
+            *proba, count = _PROBA_STRUCT.unpack_from(payload, _COMPACT_STRUCT.size)
+            record['probabilities'] = {label: round(p, 4) for label, p in zip(LABELS, proba)}
+            offset = _COMPACT_STRUCT.size + _PROBA_STRUCT.size
+            record['explanation'] = [
+                {'feature': FEATURES[j], 'contribution': round(c, 4)}
+                for j, c in (_FACTOR_STRUCT.unpack_from(payload, offset + i * _FACTOR_STRUCT.size)
+                             for i in range(count))
+            ]
+        return record
+
     def decrypt(self, encrypted_data):
-        # Decrypt data using AES-256-GCM (encrypted_data: base64 encoded data, returns: dict or string)
+        # Decrypt data using AES-256-GCM (encrypted_data: compact bytes or legacy base64 text, returns: dict or string)
+        if isinstance(encrypted_data, (bytes, bytearray, memoryview)):
+            try:
+                return self._decrypt_compact(bytes(encrypted_data))
+            except Exception as e:
+                raise ValueError(f"Decryption failed: {str(e)}")
         try:
             # Decode from base64
             encrypted_bytes = base64.b64decode(encrypted_data.encode('utf-8'))
@@ -57,11 +122,8 @@ class AES256Encryption:
             nonce = encrypted_bytes[:12]
             ciphertext = encrypted_bytes[12:]
             
-            # Create AESGCM cipher
-            aesgcm = AESGCM(self.key)
-            
             # Decrypt the data
-            decrypted_bytes = aesgcm.decrypt(nonce, ciphertext, None)
+            decrypted_bytes = self.aesgcm.decrypt(nonce, ciphertext, None)
             decrypted_str = decrypted_bytes.decode('utf-8')
             
             # Try to parse as JSON, return as string if it fails
@@ -74,18 +136,129 @@ class AES256Encryption:
             raise ValueError(f"Decryption failed: {str(e)}")
 
 
-def encrypt_prediction_data(username, inputs_dict, prediction_result):
+class CipherCache:
+    # Bounded LRU of AES256Encryption contexts keyed by username, with TTL eviction
+
+    def __init__(self, maxsize=CIPHER_CACHE_SIZE, ttl=CIPHER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(username)
+                return entry[0]
+        # Derive outside the lock; a concurrent miss for the same user just builds twice
+        cipher = AES256Encryption(username)
+        with self._lock:
+            self._entries[username] = (cipher, now)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return cipher
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cipher_cache = CipherCache()
+
+
+def get_cipher(username):
+    return _cipher_cache.get(username)
+
 
-    encryption = AES256Encryption(username)
+def encrypt_prediction_data(username, inputs_dict, prediction_result, probabilities=None, explanation=None):
+
+    encryption = get_cipher(username)
+    if prediction_result in LABELS and all(f in inputs_dict for f in FEATURES):
+        return encryption.encrypt_record(inputs_dict, prediction_result, probabilities, explanation)
+    # Labels outside LABELS (or partial inputs) keep the legacy JSON format
     data = {
         'inputs': inputs_dict,
         'prediction': prediction_result
     }
+    if probabilities:
+        data['probabilities'] = probabilities
+        data['explanation'] = explanation or []
     return encryption.encrypt(data)
 
 
 def decrypt_prediction_data(username, encrypted_data):
    
-    encryption = AES256Encryption(username)
+    encryption = get_cipher(username)
     return encryption.decrypt(encrypted_data)
 
+
+def decrypt_many(username, blobs, on_error=None):
+    # Decrypt a user's records with one cipher context. Without on_error the first failure
+    # raises; with it, on_error(index, exc) is called and that slot is returned as None.
+    encryption = get_cipher(username)
+    results = []
+    for i, blob in enumerate(blobs):
+        try:
+            results.append(encryption.decrypt(blob))
+        except ValueError as e:
+            if on_error is None:
+                raise
+            on_error(i, e)
+            results.append(None)
+    return results
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _reset_pools_after_fork():
+    # Executor threads don't survive fork; children build their own pools on demand
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+def _get_pool(workers):
+    with _pools_lock:
+        executor = _pools.get(workers)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decrypt")
+            _pools[workers] = executor
+        return executor
+
+
+def _decrypt_chunk(username, start, chunk):
+    errors = []
+    results = decrypt_many(username, chunk, on_error=lambda i, e: errors.append((start + i, e)))
+    return results, errors
+
+
+def decrypt_many_parallel(username, blobs, workers=None, chunk_size=None, on_error=None):
+    # Same contract as decrypt_many, but chunks are decrypted on a shared thread pool.
+    # Results keep input order and on_error is called from the caller's thread, in order.
+    workers = workers or DECRYPT_WORKERS
+    chunk_size = chunk_size or DECRYPT_CHUNK_SIZE
+    blobs = list(blobs)
+    if workers <= 1 or len(blobs) <= chunk_size:
+        return decrypt_many(username, blobs, on_error=on_error)
+
+    get_cipher(username)  # warm the cache once instead of racing in every worker
+    starts = range(0, len(blobs), chunk_size)
+    futures = [_get_pool(workers).submit(_decrypt_chunk, username, start, blobs[start:start + chunk_size])
+               for start in starts]
+    results = []
+    for future in futures:
+        chunk_results, errors = future.result()
+        for index, e in errors:
+            if on_error is None:
+                raise e
+            on_error(index, e)
+        results.extend(chunk_results)
+    return results
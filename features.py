@@ -0,0 +1,42 @@
+# Feature and label definitions shared by the web app, encryption and offline tools
+import numpy as np
+
+# -------- feature order (must match training) --------
+FEATURES = [
+    'Age','Gender','Height_cm','Weight_kg','BMI',
+    'Blood_Pressure_Systolic','Blood_Pressure_Diastolic',
+    'Cholesterol_Level','Blood_Sugar_Level','Genetic_Risk_Factor',
+    'Allergies','Daily_Steps','Exercise_Frequency','Sleep_Hours',
+    'Alcohol_Consumption','Smoking_Habit','Dietary_Habits',
+    'Caloric_Intake','Protein_Intake','Carbohydrate_Intake','Fat_Intake'
+]
+
+LABELS = ['Diabetes','Heart Disease','Hypertension','Obesity', 'None']
+
+# Recommended macros in Personalized_Diet_Recommendations.csv and their keys in plan dicts
+MACRO_COLUMNS = ("Recommended_Calories", "Recommended_Protein", "Recommended_Carbs", "Recommended_Fats")
+MACRO_KEYS = ("calories", "protein", "carbs", "fats")
+
+def map_label(raw):
+    try:
+        if isinstance(raw, (int, np.integer)):
+            return LABELS[int(raw)]
+        if isinstance(raw, str):
+            if raw in LABELS:
+                return raw
+            if raw.isdigit() and int(raw) < len(LABELS):
+                return LABELS[int(raw)]
+    except Exception:
+        pass
+    return str(raw)
+
+# Categorical columns as encoded at training time (sklearn LabelEncoder: sorted class order).
+# These are the codes the home.html <select> options post.
+CATEGORIES = {
+    'Gender': ['Female', 'Male', 'Other'],
+    'Genetic_Risk_Factor': ['No', 'Yes'],
+    'Allergies': ['Gluten Intolerance', 'Lactose Intolerance', 'None', 'Nut Allergy'],
+    'Alcohol_Consumption': ['No', 'Yes'],
+    'Smoking_Habit': ['No', 'Yes'],
+    'Dietary_Habits': ['Keto', 'Regular', 'Vegan', 'Vegetarian'],
+}
@@ -0,0 +1,184 @@
+# Flat array inference engine for the random forest: all trees are exported once into
+# concatenated NumPy node arrays and evaluated with vectorized traversal, bypassing
+# scikit-learn's per-call validation and per-tree dispatch
+import os
+
+import numpy as np
+
+from artifacts import atomic_write_dir
+
+# Rows x trees evaluated per traversal step; bounds the temporary (rows, trees, classes) block
+CHUNK_CELLS = int(os.environ.get("FOREST_CHUNK_CELLS", "1000000"))
+_ARRAYS = ("feature", "threshold", "left", "right", "missing_left", "value", "roots", "classes")
+
+
+class FlatForest:
+    # Node i of the whole forest: go to left[i] if x[feature[i]] <= threshold[i] else right[i].
+    # Leaves point to themselves (threshold +inf) so traversal needs no per-row branching;
+    # value[i] holds the node's normalized class distribution.
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = None
+        self.is_leaf = left == np.arange(len(left))
+        # children[2 * i] is the left child of node i, children[2 * i + 1] the right one
+        self.children = np.column_stack([left, right]).ravel()
+        self._deltas = None
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        trees = [est.tree_ for est in getattr(forest, "estimators_", [])]
+        if not trees or getattr(forest, "n_outputs_", 1) != 1 or not hasattr(forest, "classes_"):
+            raise TypeError(f"{type(forest).__name__} is not a single-output tree ensemble classifier")
+        counts = np.array([t.node_count for t in trees])
+        roots = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.intp)
+
+        feature = np.concatenate([t.feature for t in trees]).astype(np.intp)
+        threshold = np.concatenate([t.threshold for t in trees]).astype(np.float64)
+        left = np.concatenate([t.children_left + r for t, r in zip(trees, roots)]).astype(np.intp)
+        right = np.concatenate([t.children_right + r for t, r in zip(trees, roots)]).astype(np.intp)
+        is_leaf = np.concatenate([t.children_left == -1 for t in trees])
+        # Where NaN inputs go at each split (scikit-learn >= 1.3 records this per node)
+        missing_left = np.concatenate([
+            np.asarray(getattr(t, "missing_go_to_left", np.zeros(t.node_count)), dtype=bool)
+            for t in trees])
+        self_index = np.arange(len(feature), dtype=np.intp)
+        left[is_leaf] = self_index[is_leaf]
+        right[is_leaf] = self_index[is_leaf]
+        feature[is_leaf] = 0
+        threshold[is_leaf] = np.inf
+
+        # Same normalization as DecisionTreeClassifier.predict_proba
+        value = np.concatenate([t.value[:, 0, :] for t in trees]).astype(np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        value /= normalizer
+
+        engine = cls(feature, threshold, left, right, missing_left, value, roots, np.asarray(forest.classes_),
+                     max(t.max_depth for t in trees))
+        engine.n_features_in_ = getattr(forest, "n_features_in_", None)
+        return engine
+
+    def node_deltas(self):
+        # value[i] - value[parent of i] (zero at roots): how far the split leading to node i
+        # moved the class distribution. Computed once per engine and reused by explain().
+        if self._deltas is None:
+            internal = np.flatnonzero(~self.is_leaf)
+            deltas = np.zeros(self.value.shape)
+            for child in (self.left[internal], self.right[internal]):
+                deltas[child] = self.value[child] - self.value[internal]
+            self._deltas = deltas
+        return self._deltas
+
+    @property
+    def bias(self):
+        # Mean root distribution: the prediction before any split, the base of explain()
+        return self.value[self.roots].mean(axis=0)
+
+    def _leaves(self, X32, path=None):
+        # Leaf node index for every (row, tree). All (row, tree) cells advance one level per
+        # step; cells that reach a leaf drop out, so work shrinks with depth. With a `path`
+        # list, each step appends (cells, split features, child nodes) for explain().
+        n, n_features = X32.shape
+        n_trees = len(self.roots)
+        flat_x = np.ascontiguousarray(X32).ravel()
+        idx = np.tile(self.roots, n)
+        row_offset = np.repeat(np.arange(n, dtype=np.intp) * n_features, n_trees)
+        active = np.flatnonzero(~self.is_leaf[idx])
+        has_nan = bool(np.isnan(flat_x).any())
+        while active.size:
+            node = idx[active]
+            x = flat_x[row_offset[active] + self.feature[node]]
+            go_right = ~(x <= self.threshold[node])
+            if has_nan:
+                go_right &= ~(np.isnan(x) & self.missing_left[node])
+            nxt = self.children[2 * node + go_right]
+            if path is not None:
+                path.append((active, self.feature[node], nxt))
+            idx[active] = nxt
+            active = active[~self.is_leaf[nxt]]
+        return idx.reshape(n, n_trees)
+
+    def predict_proba(self, X):
+        # scikit-learn compares float32 inputs against float64 thresholds; do the same
+        X32 = np.asarray(X, dtype=np.float32)
+        if X32.ndim == 1:
+            X32 = X32.reshape(1, -1)
+        n_trees = len(self.roots)
+        proba = np.empty((X32.shape[0], self.value.shape[1]))
+        step = max(1, CHUNK_CELLS // n_trees)
+        for start in range(0, X32.shape[0], step):
+            leaves = self._leaves(X32[start:start + step])
+            proba[start:start + step] = self.value[leaves].sum(axis=1) / n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def explain(self, X):
+        # One traversal -> (proba, contributions). contributions[r, f, c] sums, over the splits
+        # on feature f along row r's paths, the change in class c probability they caused,
+        # averaged over trees (Saabas' method), so proba == bias + contributions.sum(axis=1).
+        X32 = np.asarray(X, dtype=np.float32)
+        if X32.ndim == 1:
+            X32 = X32.reshape(1, -1)
+        n, n_features = X32.shape
+        n_trees, n_classes = len(self.roots), self.value.shape[1]
+        deltas = self.node_deltas()
+        proba = np.empty((n, n_classes))
+        contributions = np.empty((n, n_features, n_classes))
+        step = max(1, CHUNK_CELLS // n_trees)
+        for start in range(0, n, step):
+            path = []
+            leaves = self._leaves(X32[start:start + step], path)
+            rows = len(leaves)
+            proba[start:start + rows] = self.value[leaves].sum(axis=1) / n_trees
+            if not path:
+                contributions[start:start + rows] = 0.0
+                continue
+            cells, features, nodes = (np.concatenate(parts) for parts in zip(*path))
+            keys = ((cells // n_trees) * n_features + features)[:, None] * n_classes + np.arange(n_classes)
+            sums = np.bincount(keys.ravel(), weights=deltas[nodes].ravel(), minlength=rows * n_features * n_classes)
+            contributions[start:start + rows] = sums.reshape(rows, n_features, n_classes) / n_trees
+        return proba, contributions
+
+    def save(self, directory):
+        # One .npy per array so load(mmap_mode="r") can map them straight from disk. Written to a
+        # temp directory and swapped in: workers may have the previous export mapped (MODEL_MMAP=1)
+        def write(tmp):
+            for name in _ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), self.classes_ if name == "classes" else getattr(self, name))
+            np.save(os.path.join(tmp, "meta.npy"), np.array([self.max_depth, self.n_features_in_ or -1]))
+
+        atomic_write_dir(directory, write)
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        # classes may be an object array, which can't be memory-mapped (and is tiny anyway)
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), allow_pickle=name == "classes",
+                                mmap_mode=None if name == "classes" else mmap_mode)
+                  for name in _ARRAYS}
+        max_depth, n_features = np.load(os.path.join(directory, "meta.npy"))
+        engine = cls(max_depth=max_depth, **arrays)
+        engine.n_features_in_ = int(n_features) if n_features >= 0 else None
+        return engine
+
+
+if __name__ == "__main__":
+    # python forest_engine.py Models/model_rf.sav [Models/model_rf.flat]
+    import sys
+    import joblib
+
+    src = sys.argv[1]
+    dst = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(src)[0] + ".flat"
+    engine = FlatForest.from_sklearn(joblib.load(src))
+    engine.save(dst)
+    print(f"Exported {len(engine.roots)} trees / {len(engine.feature)} nodes to {dst}")
@@ -0,0 +1,22 @@
+# gunicorn settings:  gunicorn -c gunicorn.conf.py app:app
+#
+# With SHARED_MODEL=1 (default) app.py is imported once in the master, so the model and
+# scaler are loaded before forking and every worker shares those pages copy-on-write.
+# SHARED_MODEL=0 loads a private copy in each worker instead.
+import os
+
+bind = os.environ.get("BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+preload_app = os.environ.get("SHARED_MODEL", "1") == "1"
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        from model_registry import registry
+        registry.prepare_for_fork()
+
+
+def worker_exit(server, worker):
+    # Commit history records still queued in this worker before it goes away
+    import db
+    db.history_writer.close()
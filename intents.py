@@ -0,0 +1,72 @@
+# Intent engine for /chat/send: every keyword is compiled into a single regex at startup and
+# tips live in an immutable index of interned tuples keyed by (disease, bucket)
+import re
+import sys
+from types import MappingProxyType
+
+# Buckets in priority order: when a message mentions several, the earlier bucket wins.
+# Keywords match as substrings of the lowercased message.
+INTENT_KEYWORDS = (
+    ("diet", ("diet", "food", "meal", "eat", "nutrition", "what to eat", "foods")),
+    ("habits", ("habit", "exercise", "workout", "walk", "steps", "sleep", "stress", "activity")),
+    ("prevention", ("prevent", "prevention", "control", "reduce risk", "avoid", "complication")),
+)
+
+
+def _trie_pattern(words):
+    # Factor keywords into a prefix tree so matching cost depends on keyword length, not count.
+    # A keyword that is a prefix of another already proves a match, so longer ones are pruned.
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node):
+        if "" in node:
+            return ""
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return emit(trie)
+
+
+class IntentMatcher:
+
+    def __init__(self, intents=INTENT_KEYWORDS):
+        self.buckets = tuple(bucket for bucket, _ in intents)
+        # A zero-width lookahead is tried at every position; its branches are in priority order,
+        # so each match reports the best bucket with a keyword starting at that position
+        branches = "|".join(f"(?P<b{i}>{_trie_pattern(words)})"
+                            for i, (_, words) in enumerate(intents) if words)
+        self._pattern = re.compile(f"(?=(?:{branches}))")
+
+    def match(self, text):
+        # Highest-priority bucket with any keyword in text, or None
+        best = None
+        for m in self._pattern.finditer(text):
+            i = int(m.lastgroup[1:])
+            if best is None or i < best:
+                best = i
+                if best == 0:
+                    break
+        return self.buckets[best] if best is not None else None
+
+
+class TipIndex:
+    # Read-only (disease, bucket) -> tuple of tips; unknown diseases fall back to `default`
+
+    def __init__(self, guidance, default="None"):
+        self.default = default
+        self.diseases = frozenset(guidance)
+        self._tips = MappingProxyType({
+            (sys.intern(disease), sys.intern(bucket)): tuple(sys.intern(tip) for tip in tips)
+            for disease, buckets in guidance.items()
+            for bucket, tips in buckets.items()
+        })
+
+    def get(self, disease, bucket):
+        if disease not in self.diseases:
+            disease = self.default
+        return self._tips.get((disease, bucket), ())
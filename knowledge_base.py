@@ -0,0 +1,65 @@
+# Chat knowledge base: tips are read lazily from guidance.json on first use and hot-reloaded
+# when the file changes, without a code deploy or worker restart
+import json
+import os
+import threading
+import time
+
+from intents import TipIndex
+
+KB_PATH = os.environ.get("KB_PATH", "guidance.json")
+# How often (seconds) a request may stat the file to look for changes
+KB_CHECK_INTERVAL = float(os.environ.get("KB_CHECK_INTERVAL", "2"))
+
+
+class KnowledgeBase:
+    # Readers take the current snapshot with a single attribute read and never lock. One
+    # thread at a time checks the file; a changed file is parsed into a new TipIndex off to the
+    # side and published by rebinding self._snapshot, so readers see the old or the new
+    # snapshot, never a partial one.
+
+    def __init__(self, path=KB_PATH, check_interval=KB_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None  # ((mtime_ns, size), TipIndex)
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def tips(self):
+        snapshot = self._snapshot
+        if self.due():
+            snapshot = self._refresh()
+        return snapshot[1]
+
+    def due(self):
+        # True when the next tips() call will touch the disk (first load or a change check)
+        return self._snapshot is None or time.monotonic() >= self._next_check
+
+    def _refresh(self):
+        first_load = self._snapshot is None
+        # Only the first load makes callers wait; later checks are skipped if one is running
+        if not self._reload_lock.acquire(blocking=first_load):
+            return self._snapshot
+        try:
+            snapshot = self._snapshot
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                st = os.stat(self.path)
+                version = (st.st_mtime_ns, st.st_size)
+                if snapshot is not None and snapshot[0] == version:
+                    return snapshot
+                with open(self.path, encoding="utf-8") as f:
+                    index = TipIndex(json.load(f))
+            except (OSError, ValueError) as e:
+                if snapshot is None:
+                    raise
+                print(f"[WARN] Keeping previous knowledge base, could not reload {self.path}: {e}")
+                return snapshot
+            snapshot = (version, index)
+            self._snapshot = snapshot
+            return snapshot
+        finally:
+            self._reload_lock.release()
+
+
+knowledge_base = KnowledgeBase()
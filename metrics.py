@@ -0,0 +1,147 @@
+# In-process latency histograms for the request hot paths, rendered in the Prometheus text
+# format on /metrics. Counts are per process: under gunicorn each worker reports its own.
+#
+# Sampling is decided once per request, so a sampled request has every stage timed and an
+# unsampled one pays only a contextvar read per span. Spans outside a request (the history
+# writer thread) are sampled individually at the same rate.
+import bisect
+import contextvars
+import os
+import random
+import threading
+import time
+
+# Fraction of requests whose stages are timed; 0 turns instrumentation off
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", "1.0"))
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_sampled = contextvars.ContextVar("metrics_sampled", default=None)
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Span:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Metrics:
+
+    def __init__(self, sample_rate=METRICS_SAMPLE_RATE, prefix="smart_health"):
+        self.sample_rate = sample_rate
+        self.prefix = prefix
+        self._stages = {}
+        self._requests = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, table, key):
+        h = table.get(key)
+        if h is None:
+            with self._lock:
+                h = table.setdefault(key, Histogram())
+        return h
+
+    def _should_sample(self):
+        return self.sample_rate >= 1.0 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    # -------- request lifecycle --------
+    def begin_request(self):
+        # Returns a token for end_request; None when this request is not sampled
+        sampled = self._should_sample()
+        _sampled.set(sampled)
+        return time.perf_counter() if sampled else None
+
+    def end_request(self, token, endpoint, status):
+        key = (endpoint or "unknown", str(status))
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+        if token is not None:
+            self._histogram(self._requests, key[0]).observe(time.perf_counter() - token)
+        _sampled.set(None)
+
+    def span(self, stage):
+        # with metrics.span("predict.transform"): ...
+        sampled = _sampled.get()
+        if sampled is None:
+            sampled = self._should_sample()
+        if not sampled:
+            return _NO_SPAN
+        return _Span(self._histogram(self._stages, stage))
+
+    # -------- exposition --------
+    def render(self):
+        lines = []
+        self._render_histograms(lines, f"{self.prefix}_stage_seconds", "stage", self._stages,
+                                "Time spent in instrumented hot-path stages (sampled)")
+        self._render_histograms(lines, f"{self.prefix}_request_seconds", "endpoint", self._requests,
+                                "Request latency by endpoint (sampled)")
+        name = f"{self.prefix}_requests_total"
+        lines.append(f"# HELP {name} Requests handled by endpoint and status (all requests)")
+        lines.append(f"# TYPE {name} counter")
+        with self._lock:
+            counts = sorted(self._counts.items())
+        for (endpoint, status), n in counts:
+            lines.append(f'{name}{{endpoint="{endpoint}",status="{status}"}} {n}')
+        name = f"{self.prefix}_metrics_sample_rate"
+        lines.append(f"# HELP {name} Fraction of requests timed")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {self.sample_rate:g}")
+        return "\n".join(lines) + "\n"
+
+    def _render_histograms(self, lines, name, label, table, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key in sorted(table):
+            counts, total = table[key].snapshot()
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{name}_bucket{{{label}="{key}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{label}="{key}"}} {total:.9f}')
+            lines.append(f'{name}_count{{{label}="{key}"}} {cumulative}')
+
+
+metrics = Metrics()
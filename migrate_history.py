@@ -0,0 +1,81 @@
+# Rewrite legacy base64-JSON prediction_history rows into the compact binary record format
+#
+#   python migrate_history.py [--db signup.db] [--batch-size 500] [--vacuum]
+#
+# Rows are processed in id order, one transaction per batch, so the tool can be stopped and
+# re-run safely; rows that are already compact are skipped by the query itself.
+import argparse
+import sqlite3
+
+from encryption import get_cipher, encrypt_prediction_data
+from features import FEATURES, LABELS
+
+SQL_SELECT_LEGACY = '''
+    SELECT id, username, encrypted_data
+    FROM prediction_history
+    WHERE id > ? AND typeof(encrypted_data) = 'text'
+    ORDER BY id
+    LIMIT ?
+'''
+SQL_UPDATE_RECORD = "UPDATE prediction_history SET encrypted_data = ? WHERE id = ?"
+
+
+def convert(username, encrypted_data):
+    # Returns the compact blob, or None when the row can't be represented compactly
+    data = get_cipher(username).decrypt(encrypted_data)
+    if not isinstance(data, dict):
+        return None
+    inputs = data.get('inputs') or {}
+    prediction = data.get('prediction')
+    if prediction not in LABELS or any(f not in inputs for f in FEATURES):
+        return None
+    try:
+        return encrypt_prediction_data(username, {f: float(inputs[f]) for f in FEATURES}, prediction)
+    except (TypeError, ValueError):
+        return None
+
+
+def migrate(path, batch_size=500, vacuum=False):
+    con = sqlite3.connect(path)
+    last_id = 0
+    converted = skipped = 0
+    try:
+        while True:
+            rows = con.execute(SQL_SELECT_LEGACY, (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            updates = []
+            for record_id, username, encrypted_data in rows:
+                try:
+                    blob = convert(username, encrypted_data)
+                except ValueError as e:
+                    print(f"Error decrypting record {record_id}: {e}")
+                    blob = None
+                if blob is None:
+                    skipped += 1
+                else:
+                    updates.append((blob, record_id))
+            with con:
+                con.executemany(SQL_UPDATE_RECORD, updates)
+            converted += len(updates)
+            last_id = rows[-1][0]
+            print(f"... up to id {last_id}: {converted} converted, {skipped} skipped")
+        if vacuum:
+            con.execute("VACUUM")
+    finally:
+        con.close()
+    return converted, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate prediction history to the compact record format")
+    parser.add_argument("--db", default="signup.db")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum", action="store_true", help="reclaim freed pages afterwards")
+    args = parser.parse_args()
+    converted, skipped = migrate(args.db, args.batch_size, args.vacuum)
+    print(f"Done: {converted} rows converted, {skipped} left unchanged")
+
+
+if __name__ == "__main__":
+    main()
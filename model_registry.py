@@ -0,0 +1,203 @@
+# Model registry: discovers artifacts under Models/, validates them against FEATURES and
+# loads them once per worker process, with a synthetic warm-up predict before serving
+import gc
+import glob
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+
+from artifacts import file_hash
+from features import FEATURES
+from forest_engine import FlatForest
+
+MODELS_DIR = os.environ.get("MODELS_DIR", "Models")
+# Explicit artifact file name under MODELS_DIR; otherwise PREFERRED_MODELS are tried in order
+MODEL_NAME = os.environ.get("MODEL_NAME")
+SCALER_NAME = os.environ.get("SCALER_NAME", "scaler.sav")
+PREFERRED_MODELS = ("model.sav", "model_rf.sav")
+ARTIFACT_PATTERNS = ("*.sav", "*.joblib", "*.pkl")
+# Memory-map numpy arrays inside uncompressed joblib artifacts instead of copying them
+MODEL_MMAP = os.environ.get("MODEL_MMAP", "0") == "1"
+# "flat" serves tree ensembles through forest_engine.FlatForest instead of scikit-learn
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "sklearn")
+# Build a FlatForest explainer at load so /predict gets probabilities and per-feature
+# contributions from one traversal (with the flat backend it is the serving engine itself)
+MODEL_EXPLAIN = os.environ.get("MODEL_EXPLAIN", "1") == "1"
+
+
+class ModelLoadError(RuntimeError):
+    pass
+
+
+def _check_features(obj, what):
+    n = getattr(obj, "n_features_in_", None)
+    if n is not None and n != len(FEATURES):
+        raise ModelLoadError(f"{what} expects {n} features, FEATURES has {len(FEATURES)}")
+    names = getattr(obj, "feature_names_in_", None)
+    if names is not None and list(names) != FEATURES:
+        raise ModelLoadError(f"{what} was fitted on columns that don't match FEATURES order")
+
+
+class ModelRegistry:
+
+    def __init__(self, models_dir=MODELS_DIR, model_name=MODEL_NAME, scaler_name=SCALER_NAME,
+                 mmap=MODEL_MMAP, backend=INFERENCE_BACKEND, explain=MODEL_EXPLAIN):
+        self.models_dir = models_dir
+        self.model_name = model_name
+        self.scaler_name = scaler_name
+        self.mmap = mmap
+        self.backend = backend
+        self.explain = explain
+        self.model = None
+        self.estimator = None
+        self.explainer = None
+        self.scaler = None
+        self.model_path = None
+        self.model_hash = None
+        self.error = None
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def discover(self):
+        # Candidate model artifacts, preferred names first, scaler excluded
+        if self.model_name:
+            return [os.path.join(self.models_dir, self.model_name)]
+        found = set()
+        for pattern in ARTIFACT_PATTERNS:
+            found.update(glob.glob(os.path.join(self.models_dir, pattern)))
+        found.discard(os.path.join(self.models_dir, self.scaler_name))
+        preferred = [os.path.join(self.models_dir, n) for n in PREFERRED_MODELS]
+        return [p for p in preferred if p in found] + sorted(found - set(preferred))
+
+    def _load_artifact(self, path):
+        return joblib.load(path, mmap_mode="r" if self.mmap else None)
+
+    def load(self, retry=False):
+        # Idempotent; raises ModelLoadError when no usable model is found. A failed load is
+        # remembered so requests don't re-read artifacts, unless retry=True.
+        if self.loaded:
+            return self
+        with self._lock:
+            if self.loaded:
+                return self
+            if self.error and not retry:
+                raise ModelLoadError(self.error)
+            start = time.perf_counter()
+            scaler_path = os.path.join(self.models_dir, self.scaler_name)
+            try:
+                scaler = self._load_artifact(scaler_path)
+                _check_features(scaler, scaler_path)
+            except Exception as e:
+                self.error = f"Could not load scaler {scaler_path}: {type(e).__name__}: {e}"
+                raise ModelLoadError(self.error)
+
+            reasons = []
+            for path in self.discover():
+                try:
+                    model = self._load_artifact(path)
+                    if not hasattr(model, "predict"):
+                        raise ModelLoadError("artifact has no predict()")
+                    _check_features(model, path)
+                    self.timings["load_seconds"] = time.perf_counter() - start
+                    self._warm_up(model, scaler)
+                except Exception as e:
+                    reasons.append(f"{path}: {type(e).__name__}: {e}")
+                    continue
+                self.estimator = model
+                if self.backend == "flat":
+                    model = self._compile(model, scaler, path)
+                self.explainer = self._explainer(model, path) if self.explain else None
+                self.model, self.scaler, self.model_path = model, scaler, path
+                self.model_hash = file_hash(path, scaler_path)
+                self.error = None
+                return self
+            self.error = "No usable model under {}: {}".format(
+                self.models_dir, "; ".join(reasons) or "no artifacts found")
+            raise ModelLoadError(self.error)
+
+    def _warm_up(self, model, scaler):
+        # One synthetic predict so lazy sklearn/joblib setup happens before the first request
+        start = time.perf_counter()
+        row = np.asarray(getattr(scaler, "mean_", np.zeros(len(FEATURES))), dtype=float).reshape(1, -1)
+        model.predict(scaler.transform(row))
+        self.timings["warmup_seconds"] = time.perf_counter() - start
+
+    def _compile(self, estimator, scaler, path):
+        # Prefer an up-to-date export next to the artifact (`python forest_engine.py <path>`),
+        # which can be memory-mapped; otherwise compile in memory. Falls back to the
+        # estimator if the model isn't a forest or the engine disagrees on a probe batch.
+        start = time.perf_counter()
+        export_dir = os.path.splitext(path)[0] + ".flat"
+        try:
+            if os.path.isdir(export_dir) and os.path.getmtime(export_dir) >= os.path.getmtime(path):
+                engine = FlatForest.load(export_dir, mmap_mode="r" if self.mmap else None)
+            else:
+                engine = FlatForest.from_sklearn(estimator)
+            probe = np.random.default_rng(0).normal(size=(64, len(FEATURES)))
+            if not np.array_equal(engine.predict(probe), estimator.predict(probe)):
+                raise ValueError("flat engine predictions differ from the estimator")
+        except Exception as e:
+            print(f"[WARN] Flat inference backend unavailable for {path}: {e}")
+            self.timings.pop("compile_seconds", None)
+            return estimator
+        self.timings["compile_seconds"] = time.perf_counter() - start
+        return engine
+
+    def _explainer(self, model, path):
+        # FlatForest with its per-node deltas precomputed; None when the model isn't a forest
+        start = time.perf_counter()
+        try:
+            engine = model if isinstance(model, FlatForest) else FlatForest.from_sklearn(model)
+            if engine is not model:
+                probe = np.random.default_rng(0).normal(size=(64, len(FEATURES)))
+                if not np.array_equal(engine.predict(probe), model.predict(probe)):
+                    raise ValueError("flat engine predictions differ from the estimator")
+            engine.node_deltas()
+        except Exception as e:
+            print(f"[WARN] Explanations unavailable for {path}: {e}")
+            return None
+        self.timings["explainer_seconds"] = time.perf_counter() - start
+        return engine
+
+    def prepare_for_fork(self):
+        # Load in the pre-fork master, then move every object allocated so far into the GC's
+        # permanent generation: collections in the workers would otherwise write to those
+        # objects' headers and un-share their copy-on-write pages
+        self.load()
+        gc.collect()
+        gc.freeze()
+        return self
+
+    def get(self):
+        # (model, scaler), loading on first use
+        self.load()
+        return self.model, self.scaler
+
+    def get_batch(self):
+        # (model, scaler) for multi-row scoring: always the scikit-learn estimator. The flat
+        # engine wins on single rows but is about half as fast as scikit-learn on large batches.
+        self.load()
+        return self.estimator, self.scaler
+
+    def status(self):
+        return {
+            "loaded": self.loaded,
+            "model_path": self.model_path,
+            "model_type": type(self.model).__name__ if self.model is not None else None,
+            "model_hash": self.model_hash,
+            "mmap": self.mmap,
+            "backend": self.backend if self.model is not self.estimator else "sklearn",
+            "explainer": self.explainer is not None,
+            "error": self.error,
+            **{k: round(v, 4) for k, v in self.timings.items()},
+        }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,148 @@
+# Prediction cache keyed by the parsed, rounded 21-value feature vector and the model hash
+# (which the app extends with the settings that shape a result; see app.result_key_prefix).
+# In-process LRU, optionally backed by a SQLite file shared between workers and restarts.
+# Values are /predict result dicts (label, probabilities, explanation); the disk tier stores
+# them as JSON. Cached dicts are shared between requests and must not be mutated.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "4096"))
+# Set to a file path (e.g. prediction_cache.db) to enable the shared on-disk tier
+PREDICTION_CACHE_DB = os.environ.get("PREDICTION_CACHE_DB")
+# Inputs are rounded to the form's precision before hashing, so 24.84 and "24.840" share a key
+PREDICTION_CACHE_DECIMALS = int(os.environ.get("PREDICTION_CACHE_DECIMALS", "2"))
+
+
+class PredictionCache:
+
+    def __init__(self, maxsize=PREDICTION_CACHE_SIZE, db_path=PREDICTION_CACHE_DB,
+                 decimals=PREDICTION_CACHE_DECIMALS):
+        self.maxsize = maxsize
+        self.decimals = decimals
+        self.model_hash = ""
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_path = db_path
+        # key -> Future of the computation currently running for it
+        self._inflight = {}
+        self.counters = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "coalesced": 0}
+
+    def _open_db(self):
+        if self._db is None and self._db_path:
+            con = sqlite3.connect(self._db_path, timeout=30, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute('''
+                CREATE TABLE IF NOT EXISTS prediction_results (
+                    key TEXT PRIMARY KEY,
+                    model_hash TEXT NOT NULL,
+                    result TEXT NOT NULL
+                )
+            ''')
+            con.commit()
+            self._db = con
+        return self._db
+
+    def _after_fork(self):
+        # Never share a SQLite handle with the pre-fork master
+        self._db = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def set_model_hash(self, model_hash):
+        # Entries made by a different model artifact or result format are dropped from both tiers
+        with self._lock:
+            if model_hash == self.model_hash:
+                return
+            self.model_hash = model_hash
+            self._entries.clear()
+            con = self._open_db()
+            if con is not None:
+                with con:
+                    con.execute("DELETE FROM prediction_results WHERE model_hash != ?", (model_hash,))
+
+    def key(self, vals):
+        vec = np.round(np.asarray(vals, dtype=np.float64), self.decimals) + 0.0  # folds -0.0 into 0.0
+        return hashlib.sha1(self.model_hash.encode("utf-8") + vec.tobytes()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                self.counters["memory_hits"] += 1
+                return result
+            con = self._open_db()
+            if con is not None:
+                row = con.execute("SELECT result FROM prediction_results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    result = json.loads(row[0])
+                    self._remember(key, result)
+                    self.counters["hits"] += 1
+                    self.counters["disk_hits"] += 1
+                    return result
+            self.counters["misses"] += 1
+            return None
+
+    def compute_once(self, key, compute):
+        # For a key get() just missed: identical submissions that arrive while compute() runs
+        # wait for it instead of recomputing, and the result is cached
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = compute()
+            self.put(key, result)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._remember(key, result)
+            con = self._open_db()
+            if con is not None:
+                with con:
+                    con.execute("INSERT OR REPLACE INTO prediction_results (key, model_hash, result) VALUES (?, ?, ?)",
+                                (key, self.model_hash, json.dumps(result)))
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else None,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "disk": bool(self._db_path),
+                "model_hash": self.model_hash[:12],
+            }
+
+
+prediction_cache = PredictionCache()
+os.register_at_fork(after_in_child=prediction_cache._after_fork)
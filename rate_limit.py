@@ -0,0 +1,110 @@
+# In-process token-bucket rate limiting for /predict, /signin and the bulk scoring routes
+# (/predict/batch, /predict/whatif, charged per row scored), keyed by session username
+# or client IP. Buckets live in a map capped at RATE_LIMIT_KEYS entries and evicted with a
+# time wheel: a key sits in the slot of its last request, and when the wheel comes back round
+# to that slot the whole slot is dropped. One turn of the wheel is at least the time a bucket
+# needs to refill, so an evicted bucket was full anyway and eviction never forgives a client.
+# While the map is full of live keys nothing is evicted early; new clients share one overflow
+# bucket until the wheel frees room.
+# Limits are per worker process.
+import math
+import os
+import threading
+import time
+
+RATE_LIMIT = os.environ.get("RATE_LIMIT", "1") == "1"
+RATE_LIMIT_KEYS = int(os.environ.get("RATE_LIMIT_KEYS", "10000"))
+RATE_LIMIT_SLOTS = int(os.environ.get("RATE_LIMIT_SLOTS", "64"))
+# Bucket shared by clients that arrive while the map is full
+OVERFLOW_KEY = "overflow:"
+# Sustained requests per second and burst size per client
+PREDICT_RATE = float(os.environ.get("PREDICT_RATE", "2"))
+PREDICT_BURST = float(os.environ.get("PREDICT_BURST", "10"))
+SIGNIN_RATE = float(os.environ.get("SIGNIN_RATE", "0.2"))
+SIGNIN_BURST = float(os.environ.get("SIGNIN_BURST", "5"))
+# Rows (batch rows or what-if scenarios) per second and burst; the burst covers one full batch
+BULK_ROW_RATE = float(os.environ.get("BULK_ROW_RATE", "500"))
+BULK_ROW_BURST = float(os.environ.get("BULK_ROW_BURST", "50000"))
+
+
+class TokenBucketLimiter:
+
+    def __init__(self, rate, burst, max_keys=RATE_LIMIT_KEYS, slots=RATE_LIMIT_SLOTS, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.slots = max(2, slots)
+        # A key is evicted at least slots - 1 ticks after its last request; that covers a
+        # full refill from empty
+        self.slot_seconds = max(burst / rate, 1.0) / (self.slots - 1)
+        self.clock = clock
+        self._buckets = {}  # key -> [tokens, last refill time, tick]
+        self._wheel = [set() for _ in range(self.slots)]
+        self._tick = None
+        self._lock = threading.Lock()
+        self.counters = {"allowed": 0, "limited": 0, "evicted": 0, "overflowed": 0}
+
+    def _advance(self, tick):
+        # Drop the slots the wheel passed since the last call; their keys are a full turn old
+        if self._tick is None:
+            self._tick = tick
+            return
+        for t in range(self._tick + 1, min(tick, self._tick + self.slots) + 1):
+            self._evict_slot(t % self.slots)
+        self._tick = max(self._tick, tick)
+
+    def _evict_slot(self, slot):
+        keys = self._wheel[slot]
+        for key in keys:
+            del self._buckets[key]
+        self.counters["evicted"] += len(keys)
+        keys.clear()
+
+    def allow(self, key, cost=1.0):
+        # -> (allowed, retry_after seconds). A cost above the burst is charged as a full bucket.
+        cost = min(cost, self.burst)
+        now = self.clock()
+        tick = int(now / self.slot_seconds)
+        with self._lock:
+            self._advance(tick)
+            bucket = self._buckets.get(key)
+            if bucket is None and len(self._buckets) >= self.max_keys:
+                # Evicting a live key could reset a limited client, so the newcomer goes untracked
+                key = OVERFLOW_KEY
+                bucket = self._buckets.get(key)
+                self.counters["overflowed"] += 1
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, tick]
+                self._wheel[tick % self.slots].add(key)
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                if bucket[2] != tick:
+                    self._wheel[bucket[2] % self.slots].discard(key)
+                    self._wheel[tick % self.slots].add(key)
+                    bucket[2] = tick
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                self.counters["allowed"] += 1
+                return True, 0.0
+            self.counters["limited"] += 1
+            return False, (cost - bucket[0]) / self.rate
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "keys": len(self._buckets), "max_keys": self.max_keys,
+                    "rate": self.rate, "burst": self.burst}
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+predict_limiter = TokenBucketLimiter(PREDICT_RATE, PREDICT_BURST)
+signin_limiter = TokenBucketLimiter(SIGNIN_RATE, SIGNIN_BURST)
+bulk_limiter = TokenBucketLimiter(BULK_ROW_RATE, BULK_ROW_BURST)
+for _limiter in (predict_limiter, signin_limiter, bulk_limiter):
+    os.register_at_fork(after_in_child=_limiter._after_fork)
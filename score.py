@@ -0,0 +1,129 @@
+# Offline scoring: streams a processed.csv / Personalized_Diet_Recommendations.csv shaped file
+# through the model in fixed-size chunks and writes each scored chunk out before reading the
+# next, so memory stays flat however large the input is
+#
+#   python score.py processed.csv scored.csv [--chunksize 50000] [--workers 4]
+#   python score.py screenings.parquet scored.parquet      (Parquet needs pyarrow)
+import argparse
+import multiprocessing
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from encoder import encoder
+from features import FEATURES, map_label
+from model_registry import registry
+
+PREDICTION_COLUMN = "Predicted_Disease"
+
+def score_chunk(df):
+    model, scaler = registry.get_batch()
+    # Rows with a missing, unknown or out-of-range value are left unscored
+    X, valid = encoder.encode_valid(df[FEATURES].to_numpy(dtype=object))
+    labels = np.full(len(df), "", dtype=object)
+    if valid.any():
+        raw = model.predict(scaler.transform(X[valid]))
+        labels[valid] = [map_label(r) for r in raw]
+    df[PREDICTION_COLUMN] = labels
+    return df, int((~valid).sum())
+
+
+def read_chunks(path, chunksize):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+    # Read everything as text: values are written back untouched and "None" stays a category
+    for df in pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False):
+        df.columns = ["" if c.startswith("Unnamed: ") else c for c in df.columns]
+        yield df
+
+
+class ChunkWriter:
+
+    def __init__(self, path):
+        self.path = path
+        self._parquet = path.endswith(".parquet")
+        self._writer = None
+        self._file = None
+
+    def write(self, df):
+        if self._parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            header = self._file is None
+            if header:
+                self._file = open(self.path, "w", newline="", encoding="utf-8")
+            df.to_csv(self._file, header=header, index=False)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+
+def _init_worker():
+    # No-op when the model was inherited from the parent through fork
+    registry.load()
+
+
+def scored_chunks(chunks, workers):
+    # Yields scored chunks in input order, keeping at most 2 * workers chunks in flight
+    if workers <= 1:
+        for df in chunks:
+            yield score_chunk(df)
+        return
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+        pending = deque()
+        for df in chunks:
+            pending.append(pool.submit(score_chunk, df))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet file of patients in streaming chunks")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=1, help="processes scoring chunks in parallel")
+    args = parser.parse_args()
+
+    # Load in the parent so a bad artifact fails before any output is written, and so forked
+    # workers share the parent's copy of the model
+    registry.prepare_for_fork() if args.workers > 1 else registry.load()
+
+    start = time.perf_counter()
+    rows = invalid = 0
+    writer = ChunkWriter(args.output)
+    try:
+        for df, bad in scored_chunks(read_chunks(args.input, args.chunksize), args.workers):
+            writer.write(df)
+            rows += len(df)
+            invalid += bad
+            elapsed = time.perf_counter() - start
+            print(f"\r{rows:,} rows scored ({rows / elapsed:,.0f} rows/s)", end="", file=sys.stderr)
+    finally:
+        writer.close()
+    print(file=sys.stderr)
+    if invalid:
+        print(f"{invalid:,} rows had missing, unrecognised or out-of-range values and were left unscored", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
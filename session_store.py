@@ -0,0 +1,205 @@
+# Server-side Flask sessions: the cookie carries only a random session ID and the data lives in
+# an in-memory dict or a local SQLite file, with a background sweeper expiring idle sessions.
+# A session expires SESSION_TTL after its last request: requests that don't change it still push
+# the expiry forward, at most once per SESSION_TOUCH_INTERVAL.
+import os
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import db
+
+# "sqlite" (default), "memory" (single-process only) or "cookie" (Flask's signed cookie)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite")
+SESSION_DB = os.environ.get("SESSION_DB", "sessions.db")
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(24 * 3600)))
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_INTERVAL", "300"))
+# Unmodified sessions get their expiry refreshed once it is this many seconds old
+SESSION_TOUCH_INTERVAL = float(os.environ.get("SESSION_TOUCH_INTERVAL", "60"))
+
+_serializer = TaggedJSONSerializer()
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # Stored expiry (epoch seconds) when loaded from the backend
+        self.expires = expires
+        # Stored ID replaced by regenerate(); save_session deletes its entry
+        self.previous_sid = None
+
+    def regenerate(self):
+        # Switch to a fresh ID when the session gains privileges (sign-in), so an ID planted
+        # before that (session fixation) stops working; the data carries over
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class MemoryBackend:
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        # -> (data, expires) or None
+        with self._lock:
+            entry = self._data.get(sid)
+        if entry is None or entry[1] < time.time():
+            return None
+        return _serializer.loads(entry[0]), entry[1]
+
+    def save(self, sid, data, ttl):
+        with self._lock:
+            self._data[sid] = (_serializer.dumps(data), time.time() + ttl)
+
+    def touch(self, sid, ttl):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is not None:
+                self._data[sid] = (entry[0], time.time() + ttl)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            for sid in [sid for sid, (_, expires) in self._data.items() if expires < now]:
+                del self._data[sid]
+
+
+class SqliteBackend:
+
+    def __init__(self, path=SESSION_DB):
+        self.pool = db.ConnectionPool(path)
+        with self.pool.connection() as con:
+            con.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )
+            ''')
+            con.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)")
+        # A pool opened here may be inherited by pre-forked workers; they need their own
+        os.register_at_fork(after_in_child=lambda: setattr(self, "pool", db.ConnectionPool(path)))
+
+    def load(self, sid):
+        # -> (data, expires) or None
+        with self.pool.connection() as con:
+            row = con.execute("SELECT data, expires FROM sessions WHERE sid = ? AND expires >= ?",
+                              (sid, time.time())).fetchone()
+        return (_serializer.loads(row[0]), row[1]) if row else None
+
+    def save(self, sid, data, ttl):
+        with self.pool.connection() as con:
+            con.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                        (sid, _serializer.dumps(data), time.time() + ttl))
+
+    def touch(self, sid, ttl):
+        with self.pool.connection() as con:
+            con.execute("UPDATE sessions SET expires = ? WHERE sid = ?", (time.time() + ttl, sid))
+
+    def delete(self, sid):
+        with self.pool.connection() as con:
+            con.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def sweep(self):
+        with self.pool.connection() as con:
+            con.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+
+
+class ServerSideSessionInterface(SessionInterface):
+
+    def __init__(self, backend, ttl=SESSION_TTL, sweep_interval=SESSION_SWEEP_INTERVAL,
+                 touch_interval=SESSION_TOUCH_INTERVAL):
+        self.backend = backend
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.touch_interval = touch_interval
+        self._sweeper = None
+        self._sweeper_pid = None
+
+    def start_sweeper(self):
+        # Started lazily (and again after a fork) so every worker process expires its sessions;
+        # safe to call on every request
+        if self._sweeper_pid == os.getpid():
+            return
+        self._sweeper_pid = os.getpid()
+        self._sweeper = threading.Thread(target=self._sweep_forever, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.backend.sweep()
+            except Exception as e:
+                print(f"Error sweeping sessions: {e}")
+
+    def open_session(self, app, request):
+        self.start_sweeper()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.backend.load(sid)
+            if entry is not None:
+                return ServerSideSession(entry[0], sid=sid, expires=entry[1])
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def needs_touch(self, session):
+        # An unmodified stored session whose expiry was last pushed over touch_interval ago
+        return (not session.modified and session.expires is not None
+                and session.expires < time.time() + self.ttl - self.touch_interval)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.previous_sid is not None:
+            self.backend.delete(session.previous_sid)
+        if not session:
+            if session.modified and not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.modified:
+            self.backend.save(session.sid, dict(session), self.ttl)
+        elif self.needs_touch(session):
+            self.backend.touch(session.sid, self.ttl)
+        if session.new:
+            response.vary.add("Cookie")
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain, path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+def make_session_interface(backend=SESSION_BACKEND):
+    # None means keep Flask's default signed-cookie sessions
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        return ServerSideSessionInterface(MemoryBackend())
+    if backend == "sqlite":
+        return ServerSideSessionInterface(SqliteBackend())
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")